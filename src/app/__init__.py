@@ -4,32 +4,67 @@ from flask import Flask, jsonify
 from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_restful import Api
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy
 from flask_jwt_extended import JWTManager
 
 
+class SQLAlchemy(BaseSQLAlchemy):
+    def create_engine(self, sa_url, engine_opts):
+        # engines are created lazily, so their pools are instrumented here
+        from .utils.metrics import metrics
+        return metrics.instrument_engine(super().create_engine(sa_url, engine_opts))
+
+
 db = SQLAlchemy()
 migrate = Migrate()
 
 try:
     from ..config import app_configuration
-    from .api.auth import SignupResource, LoginResource, LogoutResource
+    from .api.auth import SignupResource, LoginResource, RefreshResource, LogoutResource, LogoutRefreshResource
     from .api.conversation import (
         PersonalConversationResource, GroupConversationResource,
-        ConversationResource, UserConversationResource
+        ConversationResource, ConversationMembersResource, UserConversationResource
     )
     from .api.users import UserResource, SingleUserResource
-    from .api.messages import MessageResource, MessagePollResource
+    from .api.messages import (
+        MessageResource, MessageBatchResource, MessagePollResource,
+        MessageStreamResource, MessageSyncResource
+    )
+    from .utils.hub import message_hub
+    from .utils.writer import message_writer
+    from .utils.revocation import revoked_tokens
+    from .utils.hashing import password_hasher
+    from .utils.responses import response_layer
+    from .utils.cache import conversation_cache
+    from .utils.membership import membership_cache
+    from .utils.instrumentation import query_instrumentation
+    from .utils.metrics import metrics
+    from .utils.profiling import request_profiler
+    from .utils.slow_queries import slow_query_log
 
 except (ModuleNotFoundError, ImportError):
     from src.config import app_configuration
-    from src.app.api.auth import SignupResource, LoginResource, LogoutResource
+    from src.app.api.auth import SignupResource, LoginResource, RefreshResource, LogoutResource, LogoutRefreshResource
     from src.app.api.conversation import (
         PersonalConversationResource, GroupConversationResource,
-        ConversationResource, UserConversationResource
+        ConversationResource, ConversationMembersResource, UserConversationResource
     )
     from src.app.api.users import UserResource, SingleUserResource
-    from src.app.api.messages import MessageResource, MessagePollResource
+    from src.app.api.messages import (
+        MessageResource, MessageBatchResource, MessagePollResource,
+        MessageStreamResource, MessageSyncResource
+    )
+    from src.app.utils.hub import message_hub
+    from src.app.utils.writer import message_writer
+    from src.app.utils.revocation import revoked_tokens
+    from src.app.utils.hashing import password_hasher
+    from src.app.utils.responses import response_layer
+    from src.app.utils.cache import conversation_cache
+    from src.app.utils.membership import membership_cache
+    from src.app.utils.instrumentation import query_instrumentation
+    from src.app.utils.metrics import metrics
+    from src.app.utils.profiling import request_profiler
+    from src.app.utils.slow_queries import slow_query_log
 
 
 def create_flask_app(environment=os.environ.get('FLASK_ENV')):
@@ -55,6 +90,21 @@ def create_flask_app(environment=os.environ.get('FLASK_ENV')):
 
     db.init_app(app)
     migrate.init_app(app, db)
+    message_hub.init_app(app)
+    message_writer.init_app(app)
+    revoked_tokens.init_app(app)
+    password_hasher.init_app(app)
+    conversation_cache.init_app(app)
+    membership_cache.init_app(app)
+    query_instrumentation.init_app(app)
+    metrics.init_app(app)
+    metrics.add_cache('conversation', conversation_cache)
+    metrics.add_cache('membership', membership_cache)
+    # after_request hooks run last registered first, so the 304s and compression
+    # of the response layer are in place before the metrics and X-Query-* headers see it
+    response_layer.init_app(app)
+    request_profiler.init_app(app)
+    slow_query_log.init_app(app)
 
     app.url_map.strict_slashes = False
 
@@ -74,7 +124,7 @@ def create_flask_app(environment=os.environ.get('FLASK_ENV')):
     @jwt.token_in_blacklist_loader
     def check_if_token_in_blacklist(decrypted_token):
         jti = decrypted_token['jti']
-        return models.RevokedAccessToken.is_token_blacklisted(jti)
+        return revoked_tokens.is_revoked(jti)
 
     # create endpoints
     api = Api(app, prefix='/api/v1')
@@ -93,6 +143,13 @@ def create_flask_app(environment=os.environ.get('FLASK_ENV')):
         methods=['POST']
     )
 
+    api.add_resource(
+        RefreshResource,
+        '/auth/refresh',
+        endpoint='refresh',
+        methods=['POST']
+    )
+
     api.add_resource(
         LogoutResource,
         '/logout',
@@ -100,6 +157,13 @@ def create_flask_app(environment=os.environ.get('FLASK_ENV')):
         methods=['POST']
     )
 
+    api.add_resource(
+        LogoutRefreshResource,
+        '/logout/refresh',
+        endpoint='logout_refresh',
+        methods=['POST']
+    )
+
     api.add_resource(
         PersonalConversationResource,
         '/conversation/personal',
@@ -135,6 +199,13 @@ def create_flask_app(environment=os.environ.get('FLASK_ENV')):
         methods=['POST']
     )
 
+    api.add_resource(
+        MessageBatchResource,
+        '/message/batch',
+        endpoint='create_messages_batch',
+        methods=['POST']
+    )
+
     api.add_resource(
         MessageResource,
         '/conversation/<int:conversation_id>/message',
@@ -149,6 +220,20 @@ def create_flask_app(environment=os.environ.get('FLASK_ENV')):
         methods=['GET']
     )
 
+    api.add_resource(
+        MessageStreamResource,
+        '/conversation/<int:conversation_id>/stream',
+        endpoint='stream_conversation_messages',
+        methods=['GET']
+    )
+
+    api.add_resource(
+        MessageSyncResource,
+        '/sync',
+        endpoint='sync_messages',
+        methods=['POST']
+    )
+
     api.add_resource(
         ConversationResource,
         '/conversation/<int:conversation_id>',
@@ -156,6 +241,13 @@ def create_flask_app(environment=os.environ.get('FLASK_ENV')):
         methods=['GET']
     )
 
+    api.add_resource(
+        ConversationMembersResource,
+        '/conversation/<int:conversation_id>/members',
+        endpoint='get_conversation_members',
+        methods=['GET']
+    )
+
     api.add_resource(
         UserConversationResource,
         '/conversation/user/<int:user_id>',
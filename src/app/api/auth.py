@@ -1,12 +1,16 @@
+from datetime import datetime
 from flask_restful import Resource
 from flask import request, jsonify
 
 from flask_jwt_extended import (
     create_access_token, create_refresh_token,
-    jwt_required, get_raw_jwt
+    jwt_required, jwt_refresh_token_required,
+    get_jwt_identity, get_raw_jwt
 )
 
 from src.app.models import models
+from src.app.utils.hashing import HashingOverloaded
+from src.app.utils.revocation import revoked_tokens
 from src.app.utils.utils import (
     verify_signup_input, pw_encrypt,
     validate_request, verify_pw
@@ -16,6 +20,11 @@ from src.app.utils.utils import (
 User = models.User
 RevokedAccessToken = models.RevokedAccessToken
 
+SERVER_BUSY_RESPONSE = {
+    "status": "fail",
+    "message": "Server is busy, please try again later"
+}, 503, {'Retry-After': '1'}
+
 
 class SignupResource(Resource):
     @verify_signup_input
@@ -32,11 +41,16 @@ class SignupResource(Resource):
                 }
             }, 403
 
+        try:
+            pw_hash = pw_encrypt(signup_details['password'])
+        except HashingOverloaded:
+            return SERVER_BUSY_RESPONSE
+
         new_user = User(
             name=signup_details['name'],
             email=signup_details['email'],
             username=signup_details['username'],
-            password=pw_encrypt(signup_details['password'])
+            password=pw_hash
         )
         new_user.save()
 
@@ -68,7 +82,10 @@ class LoginResource(Resource):
                 "message": "User does not exist"
             }, 401
 
-        check_pw = verify_pw(payload['password'], user.password)
+        try:
+            check_pw = verify_pw(payload['password'], user.password)
+        except HashingOverloaded:
+            return SERVER_BUSY_RESPONSE
 
         if not check_pw:
             return {
@@ -93,13 +110,46 @@ class LoginResource(Resource):
         return response
 
 
+class RefreshResource(Resource):
+    @jwt_refresh_token_required
+    def post(self):
+        current_user = get_jwt_identity()
+        access_token = create_access_token(identity=current_user)
+
+        response = jsonify(dict(
+                        status="success",
+                        data={
+                            "message": "Access token refreshed",
+                            "access_token": access_token
+                        }
+                    ))
+        response.status_code = 200
+        return response
+
+
+def revoke_current_token():
+    raw_jwt = get_raw_jwt()
+    expires_at = datetime.utcfromtimestamp(raw_jwt['exp']) if 'exp' in raw_jwt else None
+    revoked_token = RevokedAccessToken(jti=raw_jwt['jti'], expires_at=expires_at)
+    revoked_token.save()
+    revoked_tokens.add(revoked_token.jti, expires_at)
+
+
 class LogoutResource(Resource):
     @jwt_required
     def post(self):
-        jti = get_raw_jwt()['jti']
-        revoked_token = RevokedAccessToken(jti=jti)
-        revoked_token.save()
+        revoke_current_token()
         return {
             "status": "success",
             "message": "You have been successfully logged out!"
         }, 200
+
+
+class LogoutRefreshResource(Resource):
+    @jwt_refresh_token_required
+    def post(self):
+        revoke_current_token()
+        return {
+            "status": "success",
+            "message": "Refresh token has been revoked"
+        }, 200
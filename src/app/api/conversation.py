@@ -1,30 +1,73 @@
 import logging
+from datetime import datetime
 from flask_restful import Resource
 from flask import request, jsonify, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
 from typing import List
 
+from src.app import db
 from src.app.models import models
+from src.app.utils.cache import conversation_cache
+from src.app.utils.membership import membership_cache
+from src.app.utils.responses import response_layer
 from src.app.utils.utils import (
-    validate_request, validate_conversation, validate_convo_participants,
-    get_last_seen, paginate_query, DEFAULT_PAGE
+    add_conversation_members, validate_request, validate_conversation, validate_convo_participants,
+    get_participants_last_seen, get_conversations_last_seen, get_user_conversations_query, get_latest_msg_id,
+    get_conversation_members_query, paginate_query, keyset_paginate_query, DEFAULT_PAGE, ITEMS_PER_PAGE,
+    MAX_ITEMS_PER_PAGE
 )
 
 
 User = models.User
 Conversation = models.Conversation
+group_convo_members = models.group_convo_members
+
+
+def serialize_members(conversation_id, members):
+    last_seen = get_participants_last_seen(conversation_id, [member.id for member in members])
+    return [
+        {
+            'id': member.id,
+            'username': member.username,
+            'name': member.name,
+            'last_seen': last_seen.get(member.id)
+        }
+        for member in members
+    ]
 
 
 class PersonalConversationResource(Resource):
 
     def _check_conversation(self, *, owner_id: int, participant_id: int):
-        conversation = Conversation.query.filter_by(owner=owner_id, type='Personal',
-                                                    personal_convo_participant=participant_id).first()
-        if conversation is None:
-            conversation = Conversation.query.filter_by(owner=participant_id, type='Personal',
-                                                        personal_convo_participant=owner_id).first()
+        return Conversation.query.filter_by(
+            personal_key=Conversation.get_personal_key(owner_id, participant_id)
+        ).first()
+
+    def _create_conversation(self, *, owner_id: int, participant, convo_type: str):
+        created_at = datetime.utcnow()
+        new_conversation = Conversation(
+            name=participant.username,
+            owner=owner_id,
+            type=convo_type,
+            personal_convo_participant=participant.id,
+            personal_key=Conversation.get_personal_key(owner_id, participant.id),
+            member_count=len({owner_id, participant.id}),
+            created_at=created_at
+        )
 
-        return conversation
+        try:
+            db.session.add(new_conversation)
+            db.session.flush()
+        except IntegrityError:
+            # a concurrent request created the same conversation first
+            db.session.rollback()
+            return None
+
+        add_conversation_members(new_conversation.id, {owner_id, participant.id}, created_at)
+        db.session.commit()
+        conversation_cache.invalidate(new_conversation.id)
+        return new_conversation
 
     @jwt_required
     @validate_request('participants')
@@ -40,6 +83,13 @@ class PersonalConversationResource(Resource):
         try:
             existing_conversation = self._check_conversation(owner_id=owner_id, participant_id=participants[0].id)
 
+            if existing_conversation is None:
+                new_conversation = self._create_conversation(owner_id=owner_id, participant=participants[0],
+                                                             convo_type=convo_type)
+                if new_conversation is None:
+                    existing_conversation = self._check_conversation(owner_id=owner_id,
+                                                                     participant_id=participants[0].id)
+
             if existing_conversation is not None:
                 response = jsonify(dict(
                     status="success",
@@ -67,15 +117,6 @@ class PersonalConversationResource(Resource):
                 response.status_code = 200
                 return response
 
-            new_conversation = Conversation(
-                name=participants[0].username,
-                owner=owner_id,
-                type=convo_type,
-                personal_convo_participant=participants[0].id
-            )
-
-            new_conversation.save()
-
             response = jsonify(dict(
                 status="success",
                 data={
@@ -111,10 +152,11 @@ class PersonalConversationResource(Resource):
 
 class GroupConversationResource(Resource):
 
-    def _add_participants(self, model, *, participants: List):
-        for participant in participants:
-            model.group_convo_members.append(participant)
-        return model
+    def _add_participants(self, conversation_id: int, *, participant_ids: List[int]):
+        db.session.execute(group_convo_members.insert().values([
+            {'conversation_id': conversation_id, 'participant_id': participant_id}
+            for participant_id in participant_ids
+        ]))
 
     @jwt_required
     @validate_request('group_name', 'participants')
@@ -129,14 +171,24 @@ class GroupConversationResource(Resource):
         current_user = User.query.get(owner_id)
 
         try:
+            created_at = datetime.utcnow()
+            members = [current_user] + [participant for participant in participants if participant.id != owner_id]
+            member_ids = [member.id for member in members]
             new_conversation = Conversation(
                 name=group_name,
                 owner=owner_id,
                 type=convo_type,
+                member_count=len(member_ids),
+                created_at=created_at
             )
-            new_conversation.group_convo_members.append(current_user)
-            updated_conversation = self._add_participants(new_conversation, participants=participants)
-            updated_conversation.save()
+
+            db.session.add(new_conversation)
+            db.session.flush()
+            self._add_participants(new_conversation.id, participant_ids=member_ids)
+            add_conversation_members(new_conversation.id, member_ids, created_at)
+            db.session.commit()
+            membership_cache.invalidate(new_conversation.id)
+            conversation_cache.invalidate(new_conversation.id)
 
             response = jsonify(dict(
                 status="success",
@@ -146,7 +198,7 @@ class GroupConversationResource(Resource):
                         'id': new_conversation.id,
                         'name': new_conversation.name,
                         "owner": new_conversation.owner,
-                        'participants': [member.serialize() for member in new_conversation.group_convo_members]
+                        'participants': [member.serialize() for member in members]
                     }
                 }
             ))
@@ -163,15 +215,49 @@ class GroupConversationResource(Resource):
 class ConversationResource(Resource):
 
     def _serialize_g_participants(self, conversation):
-        return [
-            {
-                'id': participant.id,
-                'username': participant.username,
-                'name': participant.name,
-                'last_seen': get_last_seen(conversation.id, participant.id)
-            }
-            for participant in conversation.group_convo_members
-        ]
+        members, has_more = keyset_paginate_query(get_conversation_members_query(conversation), User.id)
+        next_url = url_for(
+            'get_conversation_members',
+            conversation_id=conversation.id,
+            cursor=members[-1].id
+        ) if has_more else None
+        return serialize_members(conversation.id, members), next_url
+
+    def _serialize_conversation(self, conversation):
+        if conversation.type == 'Personal':
+            participant = User.query.get(conversation.personal_convo_participant)
+            owner = User.query.get(conversation.owner)
+            last_seen = get_participants_last_seen(conversation.id, [participant.id, owner.id])
+            last_seen_participant = last_seen.get(participant.id)
+            last_seen_owner = last_seen.get(owner.id)
+            participants = [
+                {
+                    'id': participant.id,
+                    'username': participant.username,
+                    'name': participant.name,
+                    'last_seen': last_seen_participant
+                },
+                {
+                    'id': owner.id,
+                    'username': owner.username,
+                    'name': owner.name,
+                    'last_seen': last_seen_owner
+                }
+            ]
+
+            next_url = None
+
+        if conversation.type == 'Group':
+            participants, next_url = self._serialize_g_participants(conversation)
+
+        return {
+            'id': conversation.id,
+            'name': conversation.name,
+            'owner': conversation.owner,
+            'member_count': conversation.member_count,
+            'participants': participants,
+            'next': next_url
+        }
 
     @jwt_required
     def get(self, conversation_id):
@@ -190,42 +276,77 @@ class ConversationResource(Resource):
                        "message": "Access denied"
                    }, 403
 
+        # the detail only changes when a message is sent, so the latest message id versions it
+        latest_msg_id = get_latest_msg_id(conversation_id)
+        not_modified = response_layer.check_version('conversation', conversation_id, latest_msg_id)
+        if not_modified is not None:
+            return not_modified
+
         try:
-            if conversation.type == 'Personal':
-                participant = User.query.get(conversation.personal_convo_participant)
-                owner = User.query.get(conversation.owner)
-                last_seen_participant = get_last_seen(conversation_id, participant.id)
-                last_seen_owner = get_last_seen(conversation_id, owner.id)
-                participants = [
-                    {
-                        'id': participant.id,
-                        'username': participant.username,
-                        'name': participant.name,
-                        'last_seen': last_seen_participant
-                    },
-                    {
-                        'id': owner.id,
-                        'username': owner.username,
-                        'name': owner.name,
-                        'last_seen': last_seen_owner
-                    }
-                ]
+            serialized_conversation = conversation_cache.get(conversation_id, latest_msg_id)
 
-            if conversation.type == 'Group':
-                participants = self._serialize_g_participants(conversation)
+            if serialized_conversation is None:
+                serialized_conversation = self._serialize_conversation(conversation)
+                conversation_cache.set(conversation_id, serialized_conversation, latest_msg_id)
 
             response = jsonify(dict(
                 status='success',
                 data={
-                    'Conversation': {
-                        'id': conversation.id,
-                        'name': conversation.name,
-                        'owner': conversation.owner,
-                        'participants': participants
-                    }
+                    'Conversation': serialized_conversation
                 }
             ))
-            response.status_code = 201
+            response.status_code = 200
+            return response
+
+        except Exception as error:
+            logging.error(error)
+            return {
+                       "status": "fail",
+                       "message": "Server error"
+                   }, 500
+
+
+class ConversationMembersResource(Resource):
+    @jwt_required
+    def get(self, conversation_id):
+        current_user = get_jwt_identity()
+        current_user_id = current_user['id']
+        conversation = Conversation.query.get_or_404(
+            conversation_id,
+            description=f'No conversation was found with id {conversation_id}'
+        )
+
+        is_member = validate_convo_participants(conversation=conversation, participant_id=current_user_id)
+
+        if not is_member:
+            return {
+                       "status": "fail",
+                       "message": "Access denied"
+                   }, 403
+
+        cursor = request.args.get('cursor', type=int)
+        limit = min(max(request.args.get('limit', ITEMS_PER_PAGE, type=int), 1), MAX_ITEMS_PER_PAGE)
+
+        try:
+            members, has_more = keyset_paginate_query(get_conversation_members_query(conversation), User.id,
+                                                      after=cursor, limit=limit)
+
+            response = jsonify(dict(
+                status="success",
+                data={
+                    'has_more': has_more,
+                    'limit': limit,
+                    'member_count': conversation.member_count,
+                    'next': url_for(
+                        'get_conversation_members',
+                        conversation_id=conversation_id,
+                        cursor=members[-1].id,
+                        limit=limit
+                    ) if has_more else None,
+                    'members': serialize_members(conversation_id, members)
+                }
+            ))
+            response.status_code = 200
             return response
 
         except Exception as error:
@@ -250,13 +371,11 @@ class UserConversationResource(Resource):
         page = request.args.get('page', DEFAULT_PAGE, type=int)
 
         try:
-            user = User.query.get(user_id)
-            convo_query = Conversation.query.filter(
-                (Conversation.owner == user.id) |
-                (Conversation.personal_convo_participant == user.id) |
-                (Conversation.group_convo_members.contains(user))
-            )
+            convo_query = get_user_conversations_query(user_id)
             pagination_object = paginate_query(convo_query, page)
+            last_seen = get_conversations_last_seen(
+                [conversation.id for conversation in pagination_object.items], user_id
+            )
 
             response = jsonify(dict(
                 status="success",
@@ -284,7 +403,7 @@ class UserConversationResource(Resource):
                             'type': conversation.type,
                             'owner': conversation.owner,
                             'personal_convo_participant': conversation.personal_convo_participant,
-                            'last_seen': get_last_seen(conversation.id, user_id)
+                            'last_seen': last_seen.get(conversation.id)
 
                         }
                         for conversation in pagination_object.items if
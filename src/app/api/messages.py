@@ -1,11 +1,20 @@
+import time
 import logging
+from datetime import datetime
+from contextlib import nullcontext, ExitStack
 from flask_restful import Resource
-from flask import request, jsonify, url_for
+from flask import request, jsonify, url_for, json, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+from src.app import db
 from src.app.models import models
+from src.app.utils.cache import conversation_cache
+from src.app.utils.hub import message_hub
+from src.app.utils.writer import message_writer, WriterTimeout
 from src.app.utils.utils import (
-    validate_request, paginate_query, validate_convo_participants, DEFAULT_PAGE
+    validate_request, paginate_query, keyset_paginate_query, validate_convo_participants,
+    get_user_conversations_query, get_messages_after, get_latest_msg_id, insert_messages, row_query,
+    DEFAULT_PAGE, ITEMS_PER_PAGE, MAX_ITEMS_PER_PAGE
 )
 
 User = models.User
@@ -13,6 +22,16 @@ Conversation = models.Conversation
 Message = models.Message
 
 
+def publish_messages(latest_msg_ids):
+    """
+    Wakes the requests waiting on the conversations that received messages and
+    drops their cached details
+    """
+    for conversation_id, msg_id in latest_msg_ids.items():
+        message_hub.notify(conversation_id, msg_id)
+        conversation_cache.invalidate(conversation_id)
+
+
 class MessageResource(Resource):
 
     @jwt_required
@@ -34,18 +53,34 @@ class MessageResource(Resource):
                    }, 403
 
         try:
-            new_message = Message(
-                content=content,
-                owner=current_user_id,
-                conversation_id=conversation_id
-            )
-            new_message.save()
+            new_message = {
+                'content': content,
+                'owner': current_user_id,
+                'conversation_id': conversation_id,
+                'created_at': datetime.utcnow()
+            }
+
+            if message_writer.enabled:
+                # release the connection while the writer batches this message with others
+                db.session.close()
+                try:
+                    new_message['id'] = message_writer.submit(new_message)
+                except WriterTimeout:
+                    return {
+                               "status": "fail",
+                               "message": "Server is busy, please try again later"
+                           }, 503, {'Retry-After': '1'}
+            else:
+                new_message['id'], = insert_messages([new_message])
+                db.session.commit()
+
+            publish_messages({conversation_id: new_message['id']})
 
             response = jsonify(dict(
                 status="success",
                 data={
                     "message": "Conversation created successfully",
-                    "content": new_message.serialize()
+                    "content": new_message
                 }
             ))
             response.status_code = 201
@@ -57,6 +92,49 @@ class MessageResource(Resource):
                        "message": "Server error"
                    }, 500
 
+    def _get_by_cursor(self, conversation_id, *, before, after):
+        limit = min(max(request.args.get('limit', ITEMS_PER_PAGE, type=int), 1), MAX_ITEMS_PER_PAGE)
+        msg_query = row_query(Message).filter(Message.conversation_id == conversation_id)
+
+        try:
+            messages, has_more = keyset_paginate_query(msg_query, Message.id, before=before,
+                                                       after=after, limit=limit)
+            # `next` keeps walking in the requested direction, `previous` turns back
+            direction, reverse = ('before', 'after') if before is not None else ('after', 'before')
+            edges = {
+                'before': messages[0].id if messages else None,
+                'after': messages[-1].id if messages else None
+            }
+
+            response = jsonify(dict(
+                status="success",
+                data={
+                    'has_more': has_more,
+                    'limit': limit,
+                    'next': url_for(
+                        'get_conversation_messages_paginated',
+                        conversation_id=conversation_id,
+                        limit=limit,
+                        **{direction: edges[direction]}
+                    ) if has_more else None,
+                    'previous': url_for(
+                        'get_conversation_messages_paginated',
+                        conversation_id=conversation_id,
+                        limit=limit,
+                        **{reverse: edges[reverse]}
+                    ) if messages else None,
+                    'messages': [Message.serializer(message) for message in messages]
+                }
+            ))
+            response.status_code = 200
+            return response
+        except Exception as error:
+            logging.error(error)
+            return {
+                       "status": "fail",
+                       "message": "Server error"
+                   }, 500
+
     @jwt_required
     def get(self, conversation_id):
         current_user = get_jwt_identity()
@@ -74,9 +152,15 @@ class MessageResource(Resource):
                        "message": "Access denied"
                    }, 403
 
+        before = request.args.get('before', type=int)
+        after = request.args.get('after', type=int)
+
+        if before is not None or after is not None:
+            return self._get_by_cursor(conversation_id, before=before, after=after)
+
         page = request.args.get('page', DEFAULT_PAGE, type=int)
 
-        msg_query = Message.query.filter_by(conversation_id=conversation.id)
+        msg_query = row_query(Message).filter(Message.conversation_id == conversation.id)
 
         try:
             pagination_object = paginate_query(msg_query, page)
@@ -100,7 +184,7 @@ class MessageResource(Resource):
                     'per_page': pagination_object.per_page,
                     'total': pagination_object.total,
                     'messages': [
-                        message.serialize() for message in pagination_object.items if
+                        Message.serializer(message) for message in pagination_object.items if
                         pagination_object.items is not None
                     ]
                 }
@@ -115,7 +199,94 @@ class MessageResource(Resource):
                    }, 500
 
 
+class MessageBatchResource(Resource):
+
+    def _validate_messages(self, messages):
+        max_batch_size = current_app.config.get('MESSAGE_BATCH_MAX_SIZE', 100)
+
+        if type(messages) != list or len(messages) > max_batch_size:
+            return f'messages must be a list of at most {max_batch_size} messages'
+
+        for index, message in enumerate(messages):
+            if (type(message) != dict or type(message.get('conversation_id')) != int or
+                    type(message.get('content')) != str or not message['content']):
+                return f'message {index} must have an integer conversation_id and a string content'
+
+    @jwt_required
+    @validate_request('messages')
+    def post(self):
+        payload = request.get_json()
+        current_user = get_jwt_identity()
+        current_user_id = current_user['id']
+        messages = payload['messages']
+
+        error_message = self._validate_messages(messages)
+
+        if error_message is not None:
+            return {
+                       "status": "fail",
+                       "message": error_message
+                   }, 400
+
+        conversation_ids = {message['conversation_id'] for message in messages}
+        conversations = Conversation.query.filter(Conversation.id.in_(conversation_ids)).all()
+        missing_ids = conversation_ids - {conversation.id for conversation in conversations}
+
+        if missing_ids:
+            return {
+                       "status": "fail",
+                       "message": f'No conversation was found with ids {sorted(missing_ids)}'
+                   }, 404
+
+        for conversation in conversations:
+            if not validate_convo_participants(conversation=conversation, participant_id=current_user_id):
+                return {
+                           "status": "fail",
+                           "message": "Access denied"
+                       }, 403
+
+        try:
+            created_at = datetime.utcnow()
+            msg_ids = insert_messages([
+                {
+                    'content': message['content'],
+                    'owner': current_user_id,
+                    'conversation_id': message['conversation_id'],
+                    'created_at': created_at
+                }
+                for message in messages
+            ])
+            db.session.commit()
+
+            latest_msg_ids = {}
+            for message, msg_id in zip(messages, msg_ids):
+                latest_msg_ids[message['conversation_id']] = msg_id
+            publish_messages(latest_msg_ids)
+
+            response = jsonify(dict(
+                status="success",
+                data={
+                    "message": "Messages created successfully",
+                    "ids": msg_ids
+                }
+            ))
+            response.status_code = 201
+            return response
+        except Exception as error:
+            db.session.rollback()
+            logging.error(error)
+            return {
+                       "status": "fail",
+                       "message": "Server error"
+                   }, 500
+
+
 class MessagePollResource(Resource):
+
+    def _poll(self, conversation_id, last_msg_id, limit):
+        msg_query = row_query(Message).filter(Message.conversation_id == conversation_id)
+        return keyset_paginate_query(msg_query, Message.id, after=last_msg_id, limit=limit)
+
     @jwt_required
     def get(self, conversation_id, last_msg_id):
         current_user = get_jwt_identity()
@@ -133,14 +304,156 @@ class MessagePollResource(Resource):
                        "message": "Access denied"
                    }, 403
 
+        wait = min(request.args.get('wait', 0, type=float), message_hub.max_wait)
+        limit = min(max(request.args.get('limit', MAX_ITEMS_PER_PAGE, type=int), 1), MAX_ITEMS_PER_PAGE)
+
+        try:
+            with message_hub.listen(conversation_id) if wait > 0 else nullcontext() as channel:
+                messages, has_more = self._poll(conversation_id, last_msg_id, limit)
+
+                if not messages and channel is not None:
+                    # hand the connection back to the pool while the request is parked
+                    db.session.close()
+                    if channel.wait(last_msg_id, wait):
+                        messages, has_more = self._poll(conversation_id, last_msg_id, limit)
+
+            response = jsonify(dict(
+                status="success",
+                data={
+                    'has_more': has_more,
+                    'messages': [Message.serializer(message) for message in messages]
+                }
+            ))
+            response.status_code = 200
+            return response
+        except Exception as error:
+            logging.error(error)
+            return {
+                       "status": "fail",
+                       "message": "Server error"
+                   }, 500
+
+
+class MessageStreamResource(Resource):
+
+    def _events(self, conversation_id, last_msg_id, channel):
+        keepalive = current_app.config.get('STREAM_KEEPALIVE', 15)
+        deadline = time.monotonic() + current_app.config.get('STREAM_MAX_DURATION', 300)
+
+        while time.monotonic() < deadline:
+            messages = row_query(Message).filter(
+                Message.conversation_id == conversation_id,
+                Message.id > last_msg_id
+            ).order_by(Message.id).limit(ITEMS_PER_PAGE).all()
+            events = [
+                f'id: {message.id}\nevent: message\ndata: {json.dumps(Message.serializer(message))}\n\n'
+                for message in messages
+            ]
+            # the connection is only needed while fetching, not while the stream idles
+            db.session.close()
+
+            if messages:
+                last_msg_id = messages[-1].id
+                yield ''.join(events)
+                if len(messages) == ITEMS_PER_PAGE:
+                    continue
+
+            if not channel.wait(last_msg_id, keepalive):
+                yield ': keepalive\n\n'
+
+    @jwt_required
+    def get(self, conversation_id):
+        current_user = get_jwt_identity()
+        current_user_id = current_user['id']
+        conversation = Conversation.query.get_or_404(
+            conversation_id,
+            description=f'No message was found with id {conversation_id}'
+        )
+
+        is_member = validate_convo_participants(conversation=conversation, participant_id=current_user_id)
+
+        if not is_member:
+            return {
+                       "status": "fail",
+                       "message": "Access denied"
+                   }, 403
+
+        last_msg_id = request.headers.get('Last-Event-ID', type=int)
+        if last_msg_id is None:
+            last_msg_id = request.args.get('last_event_id', type=int)
+        if last_msg_id is None:
+            last_msg_id = get_latest_msg_id(conversation_id)
+
+        # the listener is held for the lifetime of the response and released when it is closed
+        listener = ExitStack()
+        channel = listener.enter_context(message_hub.listen(conversation_id))
+
+        if channel is None:
+            listener.close()
+            return {
+                       "status": "fail",
+                       "message": "Too many open streams, try again later"
+                   }, 503
+
+        response = Response(
+            stream_with_context(self._events(conversation_id, last_msg_id, channel)),
+            mimetype='text/event-stream'
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.call_on_close(listener.close)
+        return response
+
+
+class MessageSyncResource(Resource):
+
+    def _parse_cursors(self, cursors):
+        if type(cursors) != dict or len(cursors) > MAX_ITEMS_PER_PAGE:
+            return None
+        try:
+            return {int(conversation_id): int(last_msg_id) for conversation_id, last_msg_id in cursors.items()}
+        except (TypeError, ValueError):
+            return None
+
+    @jwt_required
+    @validate_request('cursors')
+    def post(self):
+        payload = request.get_json()
+        current_user = get_jwt_identity()
+        current_user_id = current_user['id']
+
+        cursors = self._parse_cursors(payload['cursors'])
+
+        if cursors is None:
+            return {
+                       "status": "fail",
+                       "message": f'cursors must map at most {MAX_ITEMS_PER_PAGE} conversation ids to message ids'
+                   }, 400
+
+        limit = min(max(request.args.get('limit', ITEMS_PER_PAGE, type=int), 1), MAX_ITEMS_PER_PAGE)
+
         try:
-            msg = Message.query.get_or_404(last_msg_id,  description=f'No message was found with id {last_msg_id}')
-            messages = Message.query.filter(Message.conversation_id == conversation_id,
-                                            Message.created_at > msg.created_at).all()
+            member_ids = {
+                conversation_id for conversation_id, in get_user_conversations_query(current_user_id).filter(
+                    Conversation.id.in_(cursors)
+                ).with_entities(Conversation.id)
+            }
+            messages_by_conversation = get_messages_after(
+                {conversation_id: cursors[conversation_id] for conversation_id in member_ids},
+                limit
+            )
+
             response = jsonify(dict(
                 status="success",
                 data={
-                    'messages': [message.serialize() for message in messages]
+                    'conversations': {
+                        conversation_id: {
+                            'has_more': len(messages) > limit,
+                            'messages': [Message.serializer(message) for message in messages[:limit]]
+                        }
+                        for conversation_id, messages in messages_by_conversation.items()
+                    },
+                    'denied': sorted(set(cursors) - member_ids)
                 }
             ))
             response.status_code = 200
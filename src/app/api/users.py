@@ -4,7 +4,7 @@ from flask import request, jsonify, url_for
 from flask_jwt_extended import jwt_required
 
 from src.app.models import models
-from src.app.utils.utils import paginate_query, DEFAULT_PAGE
+from src.app.utils.utils import paginate_query, row_query, DEFAULT_PAGE
 
 
 User = models.User
@@ -17,7 +17,7 @@ class UserResource(Resource):
         page = request.args.get('page', DEFAULT_PAGE, type=int)
 
         try:
-            user_query = User.query
+            user_query = row_query(User)
             pagination_object = paginate_query(user_query, page)
             response = jsonify(dict(
                 status="success",
@@ -37,7 +37,7 @@ class UserResource(Resource):
                     'per_page': pagination_object.per_page,
                     'total': pagination_object.total,
                     'users': [
-                        user.serialize() for user in pagination_object.items if
+                        User.serializer(user) for user in pagination_object.items if
                         pagination_object.items is not None
                     ]
                 }
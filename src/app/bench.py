@@ -0,0 +1,268 @@
+"""
+Synthetic data and a repeatable benchmark of the API endpoints, run through `flask bench`
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from src.app import db
+from src.app.models import models
+from src.app.utils.utils import insert_messages, add_conversation_members, pw_encrypt
+
+
+User = models.User
+Conversation = models.Conversation
+ConversationMembership = models.ConversationMembership
+group_convo_members = models.group_convo_members
+
+BENCH_PASSWORD = 'bench-password'
+# keeps a multi-row INSERT under the 999 bound parameters older SQLite builds allow
+INSERT_CHUNK_SIZE = 200
+SCENARIOS = ('signup', 'login', 'send', 'history', 'poll', 'inbox', 'detail')
+
+
+def _chunks(rows, size=INSERT_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _insert_conversations(rows):
+    """
+    Inserts conversation rows and returns their ids in order
+    """
+    last_id = db.session.query(db.func.max(Conversation.id)).scalar() or 0
+    for chunk in _chunks(rows):
+        db.session.execute(Conversation.__table__.insert().values(chunk))
+    return [
+        conversation_id for conversation_id, in db.session.query(Conversation.id).filter(
+            Conversation.id > last_id
+        ).order_by(Conversation.id)
+    ]
+
+
+def _group_size(rng, max_size):
+    # most groups are small while a few are very large, as in real traffic
+    return min(max_size, int(3 * rng.paretovariate(1.1)))
+
+
+def seed(*, users=1000, personal=2000, groups=100, messages=50000, max_group_size=500, random_seed=42):
+    """
+    Bulk inserts synthetic users, personal and group conversations and messages.
+    Memberships and participant states are written the way the API writes them.
+    Every user gets BENCH_PASSWORD. Returns the number of rows created per table.
+    """
+    rng = random.Random(random_seed)
+    started_at = datetime.utcnow() - timedelta(days=30)
+
+    first_index = db.session.query(db.func.count(User.id)).scalar()
+    pw_hash = pw_encrypt(BENCH_PASSWORD)
+    user_rows = [
+        {
+            'name': f'Bench User {index}',
+            'username': f'bench_{index}',
+            'email': f'bench_{index}@bench.local',
+            'password': pw_hash
+        }
+        for index in range(first_index, first_index + users)
+    ]
+    for chunk in _chunks(user_rows):
+        db.session.execute(User.__table__.insert().values(chunk))
+    user_ids = [
+        user_id for user_id, in db.session.query(User.id).filter(
+            User.email.like('bench\\_%@bench.local', escape='\\')
+        ).order_by(User.id)
+    ][-users:]
+
+    personal_keys = set()
+    pairs = []
+    while len(pairs) < min(personal, len(user_ids) * (len(user_ids) - 1) // 2):
+        owner, participant = rng.sample(user_ids, 2)
+        personal_key = Conversation.get_personal_key(owner, participant)
+        if personal_key not in personal_keys:
+            personal_keys.add(personal_key)
+            pairs.append((owner, participant))
+
+    personal_ids = _insert_conversations([
+        {
+            'name': f'bench_{participant}',
+            'owner': owner,
+            'type': 'Personal',
+            'personal_convo_participant': participant,
+            'personal_key': Conversation.get_personal_key(owner, participant),
+            'member_count': 2,
+            'created_at': started_at
+        }
+        for owner, participant in pairs
+    ])
+
+    group_members = [rng.sample(user_ids, max(3, min(_group_size(rng, max_group_size), users)))
+                     for _ in range(groups)]
+    group_ids = _insert_conversations([
+        {
+            'name': f'Bench Group {index}',
+            'owner': members[0],
+            'type': 'Group',
+            'member_count': len(members),
+            'created_at': started_at
+        }
+        for index, members in enumerate(group_members)
+    ])
+
+    members = dict(zip(personal_ids, pairs))
+    members.update(zip(group_ids, group_members))
+
+    member_rows = [
+        {'conversation_id': conversation_id, 'participant_id': participant_id}
+        for conversation_id, participant_ids in zip(group_ids, group_members)
+        for participant_id in participant_ids
+    ]
+    for chunk in _chunks(member_rows):
+        db.session.execute(group_convo_members.insert().values(chunk))
+    for conversation_id, participant_ids in members.items():
+        add_conversation_members(conversation_id, set(participant_ids), started_at)
+
+    # busier conversations are the larger ones
+    conversation_ids = list(members)
+    weights = [len(members[conversation_id]) for conversation_id in conversation_ids]
+    step = timedelta(days=30) / max(messages, 1)
+    message_rows = []
+    for index, conversation_id in enumerate(rng.choices(conversation_ids, weights, k=messages)):
+        message_rows.append({
+            'content': f'Bench message {index}',
+            'owner': rng.choice(members[conversation_id]),
+            'conversation_id': conversation_id,
+            'created_at': started_at + step * index
+        })
+    for chunk in _chunks(message_rows):
+        insert_messages(chunk)
+
+    db.session.commit()
+    return {
+        'users': len(user_ids),
+        'personal_conversations': len(personal_ids),
+        'group_conversations': len(group_ids),
+        'group_members': len(member_rows),
+        'messages': len(message_rows)
+    }
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+class _Recorder(object):
+    """
+    Times client calls and counts the statements each of them runs
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.results = {}
+
+    def count_statement(self, *args):
+        self.statements += 1
+
+    def call(self, scenario, method, *args, expected=(200,), **kwargs):
+        statements = self.statements
+        started_at = time.perf_counter()
+        response = method(*args, **kwargs)
+        duration = time.perf_counter() - started_at
+
+        result = self.results.setdefault(scenario, {'latencies': [], 'queries': [], 'errors': 0})
+        result['latencies'].append(duration)
+        result['queries'].append(self.statements - statements)
+        if response.status_code not in expected:
+            result['errors'] += 1
+        return response
+
+    def report(self):
+        report = {}
+        for scenario in SCENARIOS:
+            result = self.results.get(scenario)
+            if not result:
+                continue
+            latencies = result['latencies']
+            report[scenario] = {
+                'requests': len(latencies),
+                'errors': result['errors'],
+                'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(_percentile(latencies, 95) * 1000, 3),
+                'p99_ms': round(_percentile(latencies, 99) * 1000, 3),
+                'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+                'queries_per_request': round(sum(result['queries']) / len(result['queries']), 2)
+            }
+        return report
+
+
+def run(app, *, iterations=200, auth_iterations=20, random_seed=42):
+    """
+    Drives the endpoints through the test client against the seeded data and
+    returns the latency percentiles and statements per request of each scenario
+    """
+    rng = random.Random(random_seed)
+    client = app.test_client()
+    recorder = _Recorder()
+
+    with app.app_context():
+        bench_users = db.session.query(User.id, User.email, User.username, User.name).filter(
+            User.email.like('bench\\_%@bench.local', escape='\\')
+        ).order_by(User.id).all()
+        if not bench_users:
+            raise RuntimeError('No benchmark data found, run `flask bench seed` first')
+
+        memberships = db.session.query(ConversationMembership.user_id, ConversationMembership.conversation_id).filter(
+            ConversationMembership.user_id.in_([user.id for user in bench_users])
+        ).all()
+        headers = {
+            user.id: {'Authorization': 'Bearer ' + create_access_token(identity={
+                'id': user.id, 'email': user.email, 'username': user.username, 'name': user.name
+            })}
+            for user in bench_users
+        }
+        engine = db.engine
+
+    event.listen(engine, 'before_cursor_execute', recorder.count_statement)
+    try:
+        run_id = int(time.time())
+        for index in range(auth_iterations):
+            recorder.call('signup', client.post, '/api/v1/auth/signup', expected=(201,), json={
+                'name': f'Bench Signup {index}',
+                'username': f'bench_signup_{run_id}_{index}',
+                'email': f'bench_signup_{run_id}_{index}@bench.invalid',
+                'password': BENCH_PASSWORD
+            })
+            recorder.call('login', client.post, '/api/v1/auth/login', json={
+                'email': rng.choice(bench_users).email, 'password': BENCH_PASSWORD
+            })
+
+        for index in range(iterations):
+            user_id, conversation_id = rng.choice(memberships)
+            user_headers = headers[user_id]
+
+            response = recorder.call(
+                'send', client.post, f'/api/v1/conversation/{conversation_id}/message/send',
+                expected=(201,), headers=user_headers, json={'content': f'Bench run message {index}'}
+            )
+            last_msg_id = ((response.get_json() or {}).get('data') or {}).get('content', {}).get('id') or 1
+
+            recorder.call('history', client.get, f'/api/v1/conversation/{conversation_id}/message',
+                          headers=user_headers, query_string={'before': last_msg_id})
+            recorder.call('poll', client.get, f'/api/v1/conversation/{conversation_id}/poll/{max(last_msg_id - 20, 0)}',
+                          headers=user_headers)
+            recorder.call('inbox', client.get, f'/api/v1/conversation/user/{user_id}', headers=user_headers)
+            recorder.call('detail', client.get, f'/api/v1/conversation/{conversation_id}', headers=user_headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', recorder.count_statement)
+
+    return {
+        'run_at': datetime.utcnow().isoformat(),
+        'database': engine.dialect.name,
+        'iterations': iterations,
+        'auth_iterations': auth_iterations,
+        'seed': random_seed,
+        'scenarios': recorder.report()
+    }
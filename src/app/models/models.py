@@ -1,17 +1,60 @@
 import sqlalchemy as sa
+from operator import attrgetter
 from sqlalchemy.orm import validates
 from datetime import datetime
 from src.app import db
 
 
+SERIALIZE_EXCLUDED_FIELDS = ('password', 'updated_at')
+
+
+class Serializer(object):
+    """
+    Converts model instances, or query rows exposing the same attribute names,
+    to dictionaries over a field tuple that is fixed when the serializer is built
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        getter = attrgetter(*self.fields) if self.fields else (lambda obj: ())
+        # attrgetter returns a bare value rather than a tuple for a single field
+        self._getter = getter if len(self.fields) != 1 else (lambda obj: (getter(obj),))
+        self._selections = {}
+
+    @classmethod
+    def for_table(cls, table):
+        return cls(column.name for column in table.columns if column.name not in SERIALIZE_EXCLUDED_FIELDS)
+
+    def select(self, include=None, exclude=None):
+        """
+        Returns the serializer for a subset of the fields, built once per subset
+        """
+        if include is None and exclude is None:
+            return self
+
+        key = (tuple(include) if include is not None else None, tuple(exclude) if exclude is not None else None)
+        serializer = self._selections.get(key)
+
+        if serializer is None:
+            serializer = self._selections[key] = Serializer(
+                field for field in self.fields
+                if (include is None or field in include) and (exclude is None or field not in exclude)
+            )
+        return serializer
+
+    def __call__(self, obj):
+        return dict(zip(self.fields, self._getter(obj)))
+
+
 class ModelOpsMixin(object):
     """
     Contains the serialize method to convert objects to a dictionary
     """
 
-    def serialize(self):
-        return {column.name: getattr(self, column.name)
-                for column in self.__table__.columns if column.name not in ['password', 'updated_at']}
+    serializer = None
+
+    def serialize(self, include=None, exclude=None):
+        return self.serializer.select(include, exclude)(self)
 
     def save(self):
         db.session.add(self)
@@ -62,15 +105,26 @@ class Conversation(db.Model, ModelOpsMixin):
     owner = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     type = db.Column(db.String(), nullable=False)
     personal_convo_participant = db.Column(db.Integer, nullable=True)
-    group_convo_members = db.relationship('User', secondary=group_convo_members, lazy='subquery',
+    personal_key = db.Column(db.String(), nullable=True)
+    # a group can hold thousands of members, so they are only loaded when queried for
+    group_convo_members = db.relationship('User', secondary=group_convo_members, lazy='dynamic',
                                           backref=db.backref('conversations', lazy=True))
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     __table_args__ = (
         sa.CheckConstraint('type IN ("Personal", "Group")',
                            name='conversation type options'),
+        db.Index('ix_conversation_personal_key', 'personal_key', unique=True),
     )
 
+    @staticmethod
+    def get_personal_key(user_id, other_user_id) -> str:
+        """
+        Identifies the personal conversation between two users regardless of who started it
+        """
+        return f'{min(user_id, other_user_id)}:{max(user_id, other_user_id)}'
+
     @validates('type')
     def validate_password_length(self, key, type) -> str:
         if type not in CONVERSATION_TYPE_ENUM:
@@ -91,17 +145,63 @@ class Message(db.Model, ModelOpsMixin):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=True)
 
+    __table_args__ = (
+        db.Index('ix_message_conversation_id_id', 'conversation_id', 'id'),
+    )
+
     def __repr__(self):
         return f'Message: {self.conversation_id} : {self.owner} : {self.content}'
 
 
+class ConversationMembership(db.Model, ModelOpsMixin):
+    __tablename__ = "conversation_membership"
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), primary_key=True)
+    last_activity_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_conversation_membership_user_id_last_activity_at',
+                 'user_id', 'last_activity_at', 'conversation_id'),
+        # lets every message send bump the activity of a conversation's members without a scan
+        db.Index('ix_conversation_membership_conversation_id_last_activity_at',
+                 'conversation_id', 'last_activity_at'),
+    )
+
+    def __repr__(self):
+        return f'ConversationMembership: {self.user_id} : {self.conversation_id}'
+
+
+class ConversationParticipantState(db.Model, ModelOpsMixin):
+    __tablename__ = "conversation_participant_state"
+
+    conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), primary_key=True)
+    participant_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'), nullable=False)
+    last_seen_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'ConversationParticipantState: {self.conversation_id} : {self.participant_id} : {self.last_message_id}'
+
+
 class RevokedAccessToken(db.Model, ModelOpsMixin):
     __tablename__ = "Revoked_token"
 
     id = db.Column(db.Integer, primary_key=True)
-    jti = db.Column(db.String(), nullable=False)
+    jti = db.Column(db.String(), nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
 
     @classmethod
     def is_token_blacklisted(cls, jti):
         query = cls.query.filter_by(jti=jti).first()
-        return bool(query)
\ No newline at end of file
+        return bool(query)
+
+    @classmethod
+    def prune_expired(cls):
+        deleted = cls.query.filter(cls.expires_at < datetime.utcnow()).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+for model in ModelOpsMixin.__subclasses__():
+    model.serializer = Serializer.for_table(model.__table__)
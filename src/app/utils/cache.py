@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import json
+
+
+class LocalCacheBackend(object):
+    """
+    Bounded in-process store that evicts the least recently used entry once full
+    and drops entries older than the TTL
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SharedCacheBackend(object):
+    """
+    Keeps entries in a store shared by every worker, such as Redis. Any client
+    offering get, setex and delete works, so tests can hand in a local stand-in.
+    """
+
+    def __init__(self, client, ttl=60, prefix='chatapi:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(f'{self.prefix}{key}')
+        return None if data is None else json.loads(data)
+
+    def set(self, key, value):
+        self.client.setex(f'{self.prefix}{key}', self.ttl, json.dumps(value))
+
+    def delete(self, key):
+        self.client.delete(f'{self.prefix}{key}')
+
+
+class ResponseCache(object):
+    """
+    Caches rendered payloads together with the version they were rendered at.
+    An entry whose version differs from the one asked for counts as a miss, so a
+    worker never serves a payload older than what the database says is current.
+
+    Configured through <NAME>_CACHE_BACKEND ('local' or 'redis'), <NAME>_CACHE_SIZE,
+    <NAME>_CACHE_TTL and <NAME>_CACHE_URL.
+    """
+
+    def __init__(self, name, app=None):
+        self.name = name
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        config_prefix = f'{self.name.upper()}_CACHE'
+        ttl = app.config.get(f'{config_prefix}_TTL', 60)
+
+        if backend is None and app.config.get(f'{config_prefix}_BACKEND', 'local') == 'redis':
+            # redis is an optional dependency, only needed for the shared backend
+            import redis
+            client = redis.Redis.from_url(app.config[f'{config_prefix}_URL'])
+            backend = SharedCacheBackend(client, ttl=ttl, prefix=f'chatapi:{self.name}:')
+
+        if backend is None:
+            backend = LocalCacheBackend(max_size=app.config.get(f'{config_prefix}_SIZE', 1024), ttl=ttl)
+
+        self.backend = backend
+        app.extensions[f'{self.name}_cache'] = self
+
+    def get(self, key, version=None):
+        entry = self.backend.get(key) if self.backend is not None else None
+
+        if entry is None or entry['version'] != version:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry['value']
+
+    def set(self, key, value, version=None):
+        if self.backend is not None:
+            self.backend.set(key, {'version': version, 'value': value})
+
+    def invalidate(self, key):
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+conversation_cache = ResponseCache('conversation')
@@ -0,0 +1,93 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from passlib.hash import sha256_crypt
+
+
+class HashingOverloaded(Exception):
+    """
+    Raised when more password hashes are pending than the hasher accepts
+    """
+
+
+def _hash(pw):
+    return sha256_crypt.hash(pw)
+
+
+def _verify(pw_str, pw_hash):
+    return sha256_crypt.verify(pw_str, pw_hash)
+
+
+class PasswordHasher(object):
+    """
+    Runs the deliberately slow sha256_crypt hashing on a bounded process pool so a
+    login storm cannot pin the request threads. Once PASSWORD_HASH_MAX_PENDING
+    hashes are queued, or a hash takes longer than PASSWORD_HASH_TIMEOUT, the
+    request is refused with HashingOverloaded.
+
+    With PASSWORD_HASH_WORKERS set to 0 hashing runs on the request thread,
+    still bounded by the same limit.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self.timeout = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+        self._slots = threading.BoundedSemaphore(app.config.get('PASSWORD_HASH_MAX_PENDING', 16))
+        app.extensions['password_hasher'] = self
+
+    def hash(self, pw):
+        return self._run(_hash, pw)
+
+    def verify(self, pw_str, pw_hash):
+        return self._run(_verify, pw_str, pw_hash)
+
+    def _run(self, fn, *args):
+        if self._slots is None:
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloaded()
+
+        if not self.workers:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # the slot stays taken until the pool is done with the job, even when the
+        # request stopped waiting for it, so the backlog remains bounded
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingOverloaded()
+
+    def _get_executor(self):
+        # a pool does not survive a fork, so every worker process starts its own
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,78 @@
+import threading
+from contextlib import contextmanager
+
+
+class _Channel(object):
+    """
+    Holds the waiters parked on a single conversation
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.latest_msg_id = 0
+        self.listeners = 0
+
+    def wait(self, last_msg_id, timeout):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.latest_msg_id > last_msg_id, timeout)
+
+
+class MessageHub(object):
+    """
+    In-process notification hub that lets poll requests park until a new
+    message is committed to the conversation they are watching.
+
+    Waiters are only woken by messages sent through the same worker process,
+    a parked request on another worker simply times out and the client polls again.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._slots = None
+        self.max_wait = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_wait = app.config.get('POLL_MAX_WAIT', 30)
+        self._slots = threading.BoundedSemaphore(app.config.get('POLL_MAX_WAITERS', 100))
+        app.extensions['message_hub'] = self
+
+    @contextmanager
+    def listen(self, conversation_id):
+        """
+        Registers the caller as a listener on the conversation.
+        Yields None when every waiter slot of this worker is taken.
+        """
+        if self._slots is None or not self._slots.acquire(blocking=False):
+            yield None
+            return
+
+        with self._lock:
+            channel = self._channels.setdefault(conversation_id, _Channel())
+            channel.listeners += 1
+
+        try:
+            yield channel
+        finally:
+            with self._lock:
+                channel.listeners -= 1
+                if channel.listeners == 0:
+                    self._channels.pop(conversation_id, None)
+            self._slots.release()
+
+    def notify(self, conversation_id, msg_id):
+        with self._lock:
+            channel = self._channels.get(conversation_id)
+
+        if channel is None:
+            return
+
+        with channel.condition:
+            channel.latest_msg_id = max(channel.latest_msg_id, msg_id)
+            channel.condition.notify_all()
+
+
+message_hub = MessageHub()
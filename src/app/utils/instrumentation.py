@@ -0,0 +1,137 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# runs of placeholders, such as the ones an IN (...) expands to, count as one
+PLACEHOLDER_RUN = re.compile(r'\?(\s*,\s*\?)+|%\(\w+\)s(\s*,\s*%\(\w+\)s)+')
+WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """
+    Normalizes a statement so the queries repeated by an N+1 loop share one shape
+    """
+    return PLACEHOLDER_RUN.sub('?, ...', WHITESPACE.sub(' ', statement)).strip()
+
+
+class QueryStats(object):
+    __slots__ = ('count', 'duration', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def repeated(self, limit=3):
+        return [(shape, count) for shape, count in self.shapes.most_common(limit) if count > 1]
+
+
+class QueryInstrumentation(object):
+    """
+    Counts the statements each request runs along with their total database time
+    and the statement shapes repeated most, which is what an N+1 loop looks like.
+
+    With QUERY_STATS_HEADERS set the numbers are returned as X-Query-* response
+    headers. A request running more statements than its endpoint's entry in
+    QUERY_BUDGETS, or QUERY_BUDGET otherwise, logs a warning.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.headers = False
+        self.budget = None
+        self.budgets = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('QUERY_INSTRUMENTATION', True)
+        self.headers = app.config.get('QUERY_STATS_HEADERS', False)
+        self.budget = app.config.get('QUERY_BUDGET')
+        self.budgets = app.config.get('QUERY_BUDGETS', {})
+        app.extensions['query_instrumentation'] = self
+
+        if not self.enabled:
+            return
+
+        # the engine is created lazily per app, so listen on every engine and keep
+        # only the statements run while a request is being handled
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def start_request(self):
+        g.query_stats = QueryStats()
+
+    def finish_request(self, response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        if self.headers:
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time-Ms'] = f'{stats.duration * 1000:.1f}'
+            repeated = stats.repeated()
+            if repeated:
+                response.headers['X-Query-Repeated'] = ' | '.join(
+                    f'{count}x {shape[:120]}' for shape, count in repeated
+                )
+
+        budget = self.budgets.get(request.endpoint, self.budget)
+        if budget is not None and stats.count > budget:
+            logging.warning('query budget exceeded %s', json.dumps({
+                'endpoint': request.endpoint,
+                'method': request.method,
+                'path': request.path,
+                'queries': stats.count,
+                'budget': budget,
+                'db_time_ms': round(stats.duration * 1000, 1),
+                'repeated': [{'shape': shape, 'count': count} for shape, count in stats.repeated()]
+            }))
+
+        return response
+
+
+def current_query_stats():
+    """
+    Statistics of the request being handled, None outside of a request
+    """
+    return g.get('query_stats') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_query_stats() is not None:
+        conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats()
+    started_at = conn.info.get('query_started_at')
+
+    if stats is None or not started_at:
+        return
+
+    stats.count += 1
+    stats.duration += time.perf_counter() - started_at.pop()
+    stats.shapes[statement_shape(statement)] += 1
+
+
+def _handle_error(context):
+    started_at = context.connection.info.get('query_started_at') if context.connection is not None else None
+    if started_at:
+        started_at.pop()
+
+
+query_instrumentation = QueryInstrumentation()
@@ -0,0 +1,84 @@
+from array import array
+from bisect import bisect_left
+
+from src.app import db
+from src.app.models import models
+from src.app.utils.cache import LocalCacheBackend
+
+
+group_convo_members = models.group_convo_members
+
+
+class _MemberArray(object):
+    """
+    Sorted array of member ids, a fraction of the size of a frozenset for large groups
+    """
+
+    __slots__ = ('_ids',)
+
+    def __init__(self, member_ids):
+        self._ids = array('q', sorted(member_ids))
+
+    def __contains__(self, member_id):
+        index = bisect_left(self._ids, member_id)
+        return index < len(self._ids) and self._ids[index] == member_id
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class MembershipCache(object):
+    """
+    Per-process map of group conversation id to the ids of its members, so the
+    membership check made by every send, read and poll is answered from memory.
+
+    Groups larger than MEMBERSHIP_CACHE_ARRAY_THRESHOLD are kept as a sorted int
+    array instead of a frozenset. Entries expire after MEMBERSHIP_CACHE_TTL seconds
+    and are dropped with invalidate whenever the members of a group change.
+    """
+
+    def __init__(self, app=None):
+        self.array_threshold = 1000
+        self.hits = 0
+        self.misses = 0
+        self._members = LocalCacheBackend()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.array_threshold = app.config.get('MEMBERSHIP_CACHE_ARRAY_THRESHOLD', 1000)
+        self._members = LocalCacheBackend(
+            max_size=app.config.get('MEMBERSHIP_CACHE_SIZE', 4096),
+            ttl=app.config.get('MEMBERSHIP_CACHE_TTL', 60)
+        )
+        app.extensions['membership_cache'] = self
+
+    def get_members(self, conversation_id):
+        members = self._members.get(conversation_id)
+
+        if members is not None:
+            self.hits += 1
+            return members
+
+        self.misses += 1
+        member_ids = [
+            participant_id for participant_id, in db.session.query(group_convo_members.c.participant_id).filter(
+                group_convo_members.c.conversation_id == conversation_id
+            )
+        ]
+        members = frozenset(member_ids) if len(member_ids) <= self.array_threshold else _MemberArray(member_ids)
+        self._members.set(conversation_id, members)
+        return members
+
+    def is_member(self, conversation_id, participant_id):
+        return participant_id in self.get_members(conversation_id)
+
+    def invalidate(self, conversation_id):
+        self._members.delete(conversation_id)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+membership_cache = MembershipCache()
@@ -0,0 +1,273 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DESCRIPTIONS = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Time to produce a response, by endpoint'),
+    'db_pool_checkouts_total': ('counter', 'Connections checked out of the pool'),
+    'db_pool_checkout_wait_seconds': ('histogram', 'Time spent waiting for a pooled connection'),
+    'cache_requests_total': ('counter', 'Cache lookups, by cache and result'),
+    'token_blacklist_lookups_total': ('counter', 'Revoked token checks, by result'),
+}
+
+
+class _Shard(object):
+    """
+    Counters written by a single thread, so updating them needs no lock
+    """
+
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.counters = {}
+        self.histograms = {}
+
+
+def _merge(target, snapshot):
+    for key, value in snapshot['counters']:
+        target['counters'][key] = target['counters'].get(key, 0) + value
+
+    for key, buckets in snapshot['histograms']:
+        merged = target['histograms'].get(key)
+        target['histograms'][key] = buckets if merged is None else [a + b for a, b in zip(merged, buckets)]
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry(object):
+    """
+    Request, connection pool, cache and token blacklist metrics exposed on /metrics
+    in the Prometheus text format.
+
+    Every thread counts into its own shard, which are only summed when scraped.
+    With METRICS_DIR set each worker process also writes its totals there every
+    METRICS_FLUSH_SECONDS, and a scrape of any worker reports the sum of them all.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.directory = None
+        self.flush_interval = 5
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {'counters': {}, 'histograms': {}}
+        self._caches = {}
+        self._flushed_at = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.directory = app.config.get('METRICS_DIR')
+        self.flush_interval = app.config.get('METRICS_FLUSH_SECONDS', 5)
+        app.extensions['metrics'] = self
+
+        if not self.enabled:
+            return
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.export)
+
+    def add_cache(self, name, cache):
+        """
+        Reports the hits and misses counted by a cache exposing stats()
+        """
+        self._caches[name] = cache
+
+    def _collect_caches(self):
+        for name, cache in list(self._caches.items()):
+            stats = cache.stats()
+            yield 'cache_requests_total', {'cache': name, 'result': 'hit'}, stats['hits']
+            yield 'cache_requests_total', {'cache': name, 'result': 'miss'}, stats['misses']
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        counters = self._shard().counters
+        key = (name, _labels(labels))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        histograms = self._shard().histograms
+        key = (name, _labels(labels))
+        buckets = histograms.get(key)
+        if buckets is None:
+            # one slot per bucket, one for +Inf, then the sum
+            buckets = histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+        buckets[bisect_left(LATENCY_BUCKETS, value)] += 1
+        buckets[-1] += value
+
+    def instrument_engine(self, engine):
+        """
+        Times how long each checkout waits for a connection from the engine's pool
+        """
+        pool = engine.pool
+        connect = pool.connect
+
+        def timed_connect():
+            started_at = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                self.inc('db_pool_checkouts_total')
+                self.observe('db_pool_checkout_wait_seconds', time.perf_counter() - started_at)
+
+        pool.connect = timed_connect
+        return engine
+
+    def snapshot(self):
+        """
+        Totals of this process
+        """
+        with self._lock:
+            live_shards = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live_shards.append(shard)
+                else:
+                    # threads come and go with the server, fold the finished ones away
+                    _merge(self._retired, self._shard_snapshot(shard))
+            self._shards = live_shards
+
+            totals = {'counters': dict(self._retired['counters']), 'histograms': dict(self._retired['histograms'])}
+            for shard in live_shards:
+                _merge(totals, self._shard_snapshot(shard))
+
+        for name, labels, value in self._collect_caches():
+            key = (name, _labels(labels))
+            totals['counters'][key] = totals['counters'].get(key, 0) + value
+
+        return {
+            'counters': list(totals['counters'].items()),
+            'histograms': list(totals['histograms'].items())
+        }
+
+    def flush(self):
+        """
+        Writes the totals of this process to METRICS_DIR for the other workers to read
+        """
+        self._flushed_at = time.monotonic()
+        if not self.directory:
+            return
+
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        temporary_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'w') as metrics_file:
+            json.dump(self.snapshot(), metrics_file)
+        os.replace(temporary_path, path)
+
+    def collect(self):
+        """
+        Totals of every worker writing to METRICS_DIR, or of this process alone
+        """
+        if not self.directory:
+            totals = {'counters': {}, 'histograms': {}}
+            _merge(totals, self.snapshot())
+            return totals
+
+        self.flush()
+        totals = {'counters': {}, 'histograms': {}}
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as metrics_file:
+                    snapshot = json.load(metrics_file)
+            except (OSError, ValueError):
+                continue
+            _merge(totals, {
+                'counters': [((name, tuple(map(tuple, labels))), value)
+                             for (name, labels), value in snapshot['counters']],
+                'histograms': [((name, tuple(map(tuple, labels))), buckets)
+                               for (name, labels), buckets in snapshot['histograms']]
+            })
+        return totals
+
+    def export(self):
+        totals = self.collect()
+        series = {}
+
+        for (name, labels), value in totals['counters'].items():
+            series.setdefault(name, []).append((labels, [f'{name}{_format_labels(labels)} {value}']))
+
+        for (name, labels), buckets in totals['histograms'].items():
+            samples = []
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets[:-1]):
+                cumulative += count
+                samples.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+            samples.append(f'{name}_sum{_format_labels(labels)} {buckets[-1]}')
+            samples.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+            series.setdefault(name, []).append((labels, samples))
+
+        lines = []
+        for name in sorted(series):
+            metric_type, description = DESCRIPTIONS.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for _, samples in sorted(series[name]):
+                lines.extend(samples)
+
+        return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _shard_snapshot(self, shard):
+        return {
+            'counters': list(shard.counters.items()),
+            'histograms': [(key, list(buckets)) for key, buckets in shard.histograms.items()]
+        }
+
+    def _start_request(self):
+        g.request_started_at = time.perf_counter()
+
+    def _finish_request(self, response):
+        started_at = g.get('request_started_at')
+        if started_at is None:
+            return response
+
+        endpoint = request.endpoint or 'unmatched'
+        self.inc('http_requests_total', endpoint=endpoint, method=request.method, status=str(response.status_code))
+        self.observe('http_request_duration_seconds', time.perf_counter() - started_at, endpoint=endpoint)
+
+        if self.directory and time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+        return response
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,116 @@
+import cProfile
+import glob
+import hashlib
+import hmac
+import io
+import os
+import pstats
+import random
+import time
+
+from flask import g, request
+
+
+PROFILE_HEADER = 'X-Profile-Signature'
+
+
+def sign_profile_request(secret, path, ttl=300):
+    """
+    Value of the X-Profile-Signature header asking to profile a request to `path`
+    within the next `ttl` seconds
+    """
+    expires = int(time.time()) + ttl
+    digest = hmac.new(secret.encode(), f'{expires}:{path}'.encode(), hashlib.sha256).hexdigest()
+    return f'{expires}:{digest}'
+
+
+def top_functions(directory, *, endpoint=None, limit=20, sort='cumulative'):
+    """
+    Aggregates the stats files of one endpoint, or of all of them, into a report
+    of the `limit` most expensive functions
+    """
+    paths = glob.glob(os.path.join(directory, f'{endpoint or "*"}.*.prof'))
+    if not paths:
+        return None
+
+    report = io.StringIO()
+    stats = pstats.Stats(*paths, stream=report)
+    report.write(f'{len(paths)} profiled requests\n')
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return report.getvalue()
+
+
+class RequestProfiler(object):
+    """
+    Runs cProfile over a PROFILE_SAMPLE_RATE fraction of the requests, and over any
+    request carrying a valid X-Profile-Signature made with PROFILE_SECRET.
+
+    Stats files are named after the endpoint and written to PROFILE_DIR, which
+    keeps the PROFILE_MAX_FILES newest. With no sample rate and no secret the
+    hooks are not installed at all.
+    """
+
+    def __init__(self, app=None):
+        self.sample_rate = 0
+        self.secret = None
+        self.directory = None
+        self.max_files = 200
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0)
+        self.secret = app.config.get('PROFILE_SECRET')
+        self.directory = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.max_files = app.config.get('PROFILE_MAX_FILES', 200)
+        app.extensions['request_profiler'] = self
+
+        if not self.sample_rate and not self.secret:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+
+    def _is_signed(self):
+        signature = request.headers.get(PROFILE_HEADER)
+        if not self.secret or not signature:
+            return False
+
+        expires, _, digest = signature.partition(':')
+        if not expires.isdigit() or int(expires) < time.time():
+            return False
+
+        expected = hmac.new(self.secret.encode(), f'{expires}:{request.path}'.encode(), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(digest, expected)
+
+    def _start_request(self):
+        if random.random() < self.sample_rate or self._is_signed():
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    def _finish_request(self, error=None):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return
+
+        profiler.disable()
+        endpoint = request.endpoint or 'unmatched'
+        profiler.dump_stats(os.path.join(self.directory, f'{endpoint}.{time.time_ns()}.{os.getpid()}.prof'))
+        self._rotate()
+
+    def _rotate(self):
+        paths = glob.glob(os.path.join(self.directory, '*.prof'))
+        if len(paths) <= self.max_files:
+            return
+
+        paths.sort(key=lambda path: int(os.path.basename(path).split('.')[-3]))
+        for path in paths[:len(paths) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,88 @@
+import gzip
+import hashlib
+import zlib
+from flask import request, g, current_app
+
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain')
+
+
+class ResponseLayer(object):
+    """
+    Tags successful GET responses with an ETag, answers a matching If-None-Match
+    with 304 Not Modified and compresses bodies of at least COMPRESS_MIN_SIZE bytes.
+
+    Resources that can tell their version cheaply call check_version before
+    rendering, so a 304 skips building the body altogether. Other responses are
+    tagged with a hash of their body.
+    """
+
+    def __init__(self, app=None):
+        self.min_size = 500
+        self.level = 6
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+        self.level = app.config.get('COMPRESS_LEVEL', 6)
+        app.after_request(self.process_response)
+        app.extensions['response_layer'] = self
+
+    def check_version(self, *version):
+        """
+        Returns a 304 response when the client already holds this version of the
+        resource, otherwise remembers the version as the ETag of the response
+        """
+        etag = hashlib.sha1(repr(version).encode()).hexdigest()
+        g.version_etag = etag
+
+        if request.if_none_match.contains_weak(etag):
+            return self._not_modified(etag)
+
+    def process_response(self, response):
+        if response.direct_passthrough or response.is_streamed:
+            return response
+
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            etag = g.get('version_etag') or hashlib.sha1(response.get_data()).hexdigest()
+
+            if request.if_none_match.contains_weak(etag):
+                return self._not_modified(etag)
+            # weak, so the tag holds for every content encoding of the body
+            response.set_etag(etag, weak=True)
+
+        return self._compress(response)
+
+    def _not_modified(self, etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _compress(self, response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+
+        if len(data) < self.min_size:
+            return response
+
+        # honours q values, so gzip;q=0 rules gzip out and leaves the body as is
+        # when neither encoding is acceptable
+        encoding = request.accept_encodings.best_match(('gzip', 'deflate'))
+
+        if encoding == 'gzip':
+            response.set_data(gzip.compress(data, self.level))
+            response.headers['Content-Encoding'] = 'gzip'
+        elif encoding == 'deflate':
+            response.set_data(zlib.compress(data, self.level))
+            response.headers['Content-Encoding'] = 'deflate'
+
+        return response
+
+
+response_layer = ResponseLayer()
@@ -0,0 +1,77 @@
+import threading
+import time
+from datetime import datetime
+
+from src.app import db
+from src.app.models import models
+from src.app.utils.metrics import metrics
+
+
+RevokedAccessToken = models.RevokedAccessToken
+
+
+class RevokedTokenCache(object):
+    """
+    Per-process set of revoked token ids, so the blacklist check made by every
+    authenticated request is answered from memory.
+
+    The set is loaded on first use and then refreshed with the rows added since
+    the last refresh, which picks up the logouts handled by other workers. Ids
+    are taken at insert time but rows show up at commit, so each refresh also
+    re-reads the last REVOKED_TOKEN_LOOKBACK_ROWS ids for rows committed late.
+    """
+
+    def __init__(self, app=None):
+        self.refresh_interval = 5
+        self.lookback = 1000
+        self._lock = threading.Lock()
+        self._revoked = {}
+        self._last_id = 0
+        self._refreshed_at = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_interval = app.config.get('REVOKED_TOKEN_REFRESH_SECONDS', 5)
+        self.lookback = app.config.get('REVOKED_TOKEN_LOOKBACK_ROWS', 1000)
+        app.extensions['revoked_tokens'] = self
+
+    def is_revoked(self, jti):
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self._refresh()
+        revoked = jti in self._revoked
+        metrics.inc('token_blacklist_lookups_total', result='revoked' if revoked else 'allowed')
+        return revoked
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def _is_stale(self):
+        return self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval
+
+    def _refresh(self):
+        new_tokens = db.session.query(
+            RevokedAccessToken.id, RevokedAccessToken.jti, RevokedAccessToken.expires_at
+        ).filter(
+            RevokedAccessToken.id > self._last_id - self.lookback
+        ).order_by(RevokedAccessToken.id)
+
+        revoked = dict(self._revoked)
+        for token_id, jti, expires_at in new_tokens:
+            revoked[jti] = expires_at
+            self._last_id = max(self._last_id, token_id)
+
+        # an expired token is rejected before the blacklist is consulted, so it can be forgotten
+        now = datetime.utcnow()
+        self._revoked = {
+            jti: expires_at for jti, expires_at in revoked.items()
+            if expires_at is None or expires_at > now
+        }
+        self._refreshed_at = time.monotonic()
+
+
+revoked_tokens = RevokedTokenCache()
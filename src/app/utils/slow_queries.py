@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.app.utils.instrumentation import statement_shape
+
+
+def parameter_shape(parameters):
+    """
+    Types of the bound parameters, never their values
+    """
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class SlowQueryLog(object):
+    """
+    Appends every statement slower than SLOW_QUERY_THRESHOLD_MS to SLOW_QUERY_LOG
+    as a JSON line holding its shape, bound parameter types, endpoint and duration.
+
+    With SLOW_QUERY_EXPLAIN set, the first slow occurrence of each SELECT shape is
+    also explained (EXPLAIN QUERY PLAN on SQLite) on the connection that ran it.
+    """
+
+    def __init__(self, app=None):
+        self.threshold = None
+        self.explain = False
+        self.path = None
+        self._lock = threading.Lock()
+        self._explained = set()
+        self._local = threading.local()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS')
+        self.threshold = threshold_ms / 1000 if threshold_ms is not None else None
+        self.explain = app.config.get('SLOW_QUERY_EXPLAIN', False)
+        self.path = app.config.get('SLOW_QUERY_LOG') or os.path.join(app.instance_path, 'slow_queries.jsonl')
+        app.extensions['slow_query_log'] = self
+
+        if self.threshold is None:
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_started_at', []).append(time.perf_counter())
+
+    def _handle_error(self, context):
+        started_at = context.connection.info.get('slow_query_started_at') if context.connection is not None else None
+        if started_at:
+            started_at.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info.get('slow_query_started_at')
+        if not started_at:
+            return
+
+        duration = time.perf_counter() - started_at.pop()
+        # the EXPLAIN below runs on the same connection and must not log itself
+        if self.threshold is None or duration < self.threshold or getattr(self._local, 'explaining', False):
+            return
+
+        shape = statement_shape(statement)
+        record = {
+            'at': datetime.utcnow().isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'statement': shape,
+            'parameters': parameter_shape(parameters),
+            'executemany': executemany
+        }
+
+        if self.explain and not executemany and self._first_occurrence(shape):
+            record['plan'] = self._explain(conn, cursor, statement, parameters)
+
+        logging.warning('slow query %.1fms on %s: %s', record['duration_ms'], record['endpoint'], shape[:200])
+        with self._lock:
+            with open(self.path, 'a') as log_file:
+                log_file.write(json.dumps(record, default=str) + '\n')
+
+    def _first_occurrence(self, shape):
+        if not shape.upper().startswith(('SELECT', 'WITH')):
+            return False
+
+        with self._lock:
+            if shape in self._explained:
+                return False
+            self._explained.add(shape)
+            return True
+
+    def _explain(self, conn, cursor, statement, parameters):
+        is_sqlite = conn.dialect.name == 'sqlite'
+        explain_cursor = cursor.connection.cursor()
+        self._local.explaining = True
+
+        try:
+            # a failed statement aborts the whole transaction on PostgreSQL, so fence it off
+            if not is_sqlite:
+                explain_cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                explain_cursor.execute(f'{"EXPLAIN QUERY PLAN" if is_sqlite else "EXPLAIN"} {statement}', parameters)
+                plan = [list(row) for row in explain_cursor.fetchall()]
+            except Exception as error:
+                if not is_sqlite:
+                    explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                return {'error': str(error)}
+            if not is_sqlite:
+                explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            return plan
+        finally:
+            self._local.explaining = False
+            explain_cursor.close()
+
+
+slow_query_log = SlowQueryLog()
@@ -1,5 +1,6 @@
 import logging
-from passlib.hash import sha256_crypt
+from datetime import timedelta
+from sqlalchemy.dialects import postgresql
 from flask_restful import reqparse
 from functools import wraps
 from flask import request, jsonify
@@ -10,59 +11,280 @@ from flask_jwt_extended import (
 
 from src.app.models import models
 from src.app import db
+from src.app.utils.hashing import password_hasher
+from src.app.utils.membership import membership_cache
 
 
 User = models.User
 Message = models.Message
 Conversation = models.Conversation
+ConversationMembership = models.ConversationMembership
+ConversationParticipantState = models.ConversationParticipantState
 group_convo_members = models.group_convo_members
 
 ITEMS_PER_PAGE = 20
+MAX_ITEMS_PER_PAGE = 100
 DEFAULT_PAGE = 1
+# activity within this interval does not move a conversation in its members' inboxes again,
+# which bounds how often a busy group rewrites the membership rows of all its members
+ACTIVITY_RESOLUTION = timedelta(seconds=30)
 
 
-def get_last_seen(conversation_id, participant_id):
-    last_user_msg = Message.query.filter(
-        Message.conversation_id == conversation_id,
-        Message.owner == participant_id
-    ).order_by(Message.created_at.desc()).first()
+def get_latest_msg_id(conversation_id):
+    latest_msg_id = db.session.query(db.func.max(Message.id)).filter(
+        Message.conversation_id == conversation_id
+    ).scalar()
+    return latest_msg_id or 0
+
 
-    return last_user_msg.created_at if last_user_msg is not None else None
+def get_last_seen(conversation_id, participant_id):
+    return get_participants_last_seen(conversation_id, [participant_id]).get(participant_id)
+
+
+def get_participants_last_seen(conversation_id, participant_ids):
+    """
+    Maps each of the participant ids to the time of their last message in the conversation
+    """
+    if not participant_ids:
+        return {}
+
+    states = db.session.query(
+        ConversationParticipantState.participant_id, ConversationParticipantState.last_seen_at
+    ).filter(
+        ConversationParticipantState.conversation_id == conversation_id,
+        ConversationParticipantState.participant_id.in_(participant_ids)
+    )
+    return dict(states)
+
+
+def get_conversations_last_seen(conversation_ids, participant_id):
+    """
+    Maps each of the conversation ids to the time of the participant's last message in it
+    """
+    if not conversation_ids:
+        return {}
+
+    states = db.session.query(
+        ConversationParticipantState.conversation_id, ConversationParticipantState.last_seen_at
+    ).filter(
+        ConversationParticipantState.participant_id == participant_id,
+        ConversationParticipantState.conversation_id.in_(conversation_ids)
+    )
+    return dict(states)
+
+
+def update_participant_state(rows, msg_ids):
+    """
+    Records the newest of the given messages as the last one of its sender in the conversation
+    """
+    latest = {}
+    for row, msg_id in zip(rows, msg_ids):
+        latest[(row['conversation_id'], row['owner'])] = (msg_id, row['created_at'])
+
+    states = [
+        {
+            'conversation_id': conversation_id,
+            'participant_id': participant_id,
+            'last_message_id': msg_id,
+            'last_seen_at': created_at
+        }
+        for (conversation_id, participant_id), (msg_id, created_at) in latest.items()
+    ]
+    state_table = ConversationParticipantState.__table__
+
+    if db.engine.dialect.name == 'postgresql':
+        statement = postgresql.insert(state_table).values(states)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[state_table.c.conversation_id, state_table.c.participant_id],
+            set_={
+                'last_message_id': statement.excluded.last_message_id,
+                'last_seen_at': statement.excluded.last_seen_at
+            },
+            where=state_table.c.last_message_id < statement.excluded.last_message_id
+        ))
+        return
+
+    # writers are serialized on SQLite, so updating first and inserting the misses is safe
+    for state in states:
+        updated = db.session.execute(state_table.update().where(
+            (state_table.c.conversation_id == state['conversation_id']) &
+            (state_table.c.participant_id == state['participant_id'])
+        ).where(
+            state_table.c.last_message_id < state['last_message_id']
+        ).values(
+            last_message_id=state['last_message_id'],
+            last_seen_at=state['last_seen_at']
+        ))
+        if updated.rowcount == 0:
+            db.session.execute(state_table.insert().prefix_with('OR IGNORE').values(state))
+
+
+def row_query(model):
+    """
+    Query over the serialized columns of the model. It yields plain named rows that
+    skip the identity map and never load the columns left out of the serializer.
+    """
+    return db.session.query(*(getattr(model, field) for field in model.serializer.fields))
+
+
+def get_user_conversations_query(user_id):
+    """
+    Conversations of the user, most recently active first
+    """
+    return Conversation.query.join(
+        ConversationMembership, ConversationMembership.conversation_id == Conversation.id
+    ).filter(
+        ConversationMembership.user_id == user_id
+    ).order_by(
+        ConversationMembership.last_activity_at.desc(), ConversationMembership.conversation_id.desc()
+    )
+
+
+def get_conversation_members_query(conversation):
+    """
+    Query over the id, username and name of the members of the conversation
+    """
+    member_query = db.session.query(User.id, User.username, User.name)
+
+    if conversation.type == 'Personal':
+        return member_query.filter(User.id.in_([conversation.owner, conversation.personal_convo_participant]))
+
+    return member_query.join(
+        group_convo_members, group_convo_members.c.participant_id == User.id
+    ).filter(
+        group_convo_members.c.conversation_id == conversation.id
+    )
+
+
+def add_conversation_members(conversation_id, user_ids, last_activity_at):
+    db.session.execute(ConversationMembership.__table__.insert().values([
+        {'user_id': user_id, 'conversation_id': conversation_id, 'last_activity_at': last_activity_at}
+        for user_id in user_ids
+    ]))
+
+
+def update_conversation_activity(rows):
+    latest = {}
+    for row in rows:
+        latest[row['conversation_id']] = row['created_at']
+
+    membership_table = ConversationMembership.__table__
+    for conversation_id, created_at in latest.items():
+        db.session.execute(membership_table.update().where(
+            (membership_table.c.conversation_id == conversation_id) &
+            (membership_table.c.last_activity_at < created_at - ACTIVITY_RESOLUTION)
+        ).values(last_activity_at=created_at))
+
+
+def get_messages_after(cursors, limit=ITEMS_PER_PAGE):
+    """
+    Fetches the messages following each cursor of a {conversation_id: last_msg_id} map
+    in a single statement, reading at most `limit` + 1 messages per conversation
+    """
+    if not cursors:
+        return {}
+
+    # one branch per conversation, each stopping after limit + 1 rows of the
+    # (conversation_id, id) index however long the backlog behind the cursor is
+    columns = [Message.__table__.c[field] for field in Message.serializer.fields]
+    branches = [
+        db.select([
+            db.select(columns).where(
+                (Message.conversation_id == conversation_id) & (Message.id > last_msg_id)
+            ).order_by(Message.id).limit(limit + 1).alias()
+        ])
+        for conversation_id, last_msg_id in cursors.items()
+    ]
+    statement = branches[0] if len(branches) == 1 else db.union_all(*branches)
+    messages = sorted(db.session.execute(statement), key=lambda message: message.id)
+
+    messages_by_conversation = {conversation_id: [] for conversation_id in cursors}
+    for message in messages:
+        messages_by_conversation[message.conversation_id].append(message)
+    return messages_by_conversation
+
+
+def insert_messages(rows):
+    """
+    Inserts message rows with a single multi-row INSERT, records them in the participant
+    state and membership activity and returns their ids in order. Committing is left to the caller.
+    """
+    statement = Message.__table__.insert().values(rows)
+
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite has no RETURNING here but serializes writers, so the new ids are the
+        # contiguous range ending at the last inserted row id
+        last_msg_id = db.session.execute(statement).lastrowid
+        msg_ids = list(range(last_msg_id - len(rows) + 1, last_msg_id + 1))
+    else:
+        msg_ids = [msg_id for msg_id, in db.session.execute(statement.returning(Message.id))]
+
+    update_participant_state(rows, msg_ids)
+    update_conversation_activity(rows)
+    return msg_ids
 
 
 def paginate_query(query, page=DEFAULT_PAGE, per_page=ITEMS_PER_PAGE):
     return query.paginate(page, per_page, False)
 
 
-def validate_convo_participants(*, conversation, participant_id):
-    convo_type = conversation.type
+def keyset_paginate_query(query, column, *, before=None, after=None, limit=ITEMS_PER_PAGE):
+    """
+    Returns up to `limit` rows next to the cursor in ascending `column` order and
+    whether more rows lie beyond them. Seeks on `column` instead of using OFFSET/COUNT.
+    """
+    if before is not None:
+        items = query.filter(column < before).order_by(column.desc()).limit(limit + 1).all()
+        return items[:limit][::-1], len(items) > limit
 
-    if convo_type == 'Personal' and (conversation.owner != participant_id and
-                                     conversation.personal_convo_participant != participant_id):
-        return False
+    if after is not None:
+        query = query.filter(column > after)
 
-    group_user = db.session.query(group_convo_members).filter_by(
-        conversation_id=conversation.id, participant_id=participant_id
-    ).first()
+    items = query.order_by(column).limit(limit + 1).all()
+    return items[:limit], len(items) > limit
 
-    if convo_type == 'Group' and group_user is None:
-        return False
 
-    return True
+def validate_convo_participants(*, conversation, participant_id):
+    if conversation.type == 'Personal':
+        return participant_id in (conversation.owner, conversation.personal_convo_participant)
 
+    if conversation.type == 'Group':
+        return membership_cache.is_member(conversation.id, participant_id)
+
+    return True
 
-def validate_participants(users):
-    validated_users = []
-    validated_users_append = validated_users.append
 
+def get_participant_ids(users):
+    """
+    Converts the participant ids to integers, dropping duplicates.
+    Returns the ids in the order given along with the ones that are not integers.
+    """
+    user_ids, invalid_ids = [], []
     for user in users:
-        valid_user = User.query.get(user['id'])
+        user_id = user.get('id') if isinstance(user, dict) else None
+        try:
+            # bools are ints to Python and floats would be truncated silently
+            if isinstance(user_id, (bool, float)):
+                raise TypeError
+            user_ids.append(int(user_id))
+        except (TypeError, ValueError):
+            invalid_ids.append(user_id)
+    return list(dict.fromkeys(user_ids)), invalid_ids
+
+
+def validate_participants(user_ids):
+    """
+    Resolves the participant ids with a single query.
+    Returns the users in the order given along with the ids that do not exist.
+    """
+    found_users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
 
-        if valid_user is None:
-            logging.error(f'User with id {user["id"]} not found')
-            return []
-        validated_users_append(valid_user)
-    return validated_users
+    missing_ids = [user_id for user_id in user_ids if user_id not in found_users]
+    if missing_ids:
+        logging.error(f'Users with ids {missing_ids} not found')
+        return [], missing_ids
+
+    return [found_users[user_id] for user_id in user_ids], []
 
 
 def validate_conversation(fn):
@@ -70,7 +292,15 @@ def validate_conversation(fn):
     def decorated(*args, **kwargs):
         request_payload = request.get_json()
         current_user = get_jwt_identity()
-        validated_users = validate_participants(request_payload['participants'])
+        user_ids, invalid_ids = get_participant_ids(request_payload['participants'])
+        if invalid_ids:
+            return {
+                       "status": "fail",
+                       "message": "Participant ids must be integers",
+                       "data": {"invalid_ids": invalid_ids}
+                   }, 400
+
+        validated_users, missing_ids = validate_participants(user_ids)
         convo_type = None
         group_name = None
 
@@ -86,7 +316,8 @@ def validate_conversation(fn):
         if not validated_users:
             return {
                 "status": "fail",
-                "message": "Conversation can only occur with at least one valid user"
+                "message": "Conversation can only occur with at least one valid user",
+                "data": {"missing_ids": missing_ids}
             }
 
         if request_path.find('personal') != -1 and len(validated_users) > 1:
@@ -108,11 +339,11 @@ def validate_conversation(fn):
 
 
 def pw_encrypt(pw):
-    return sha256_crypt.hash(pw)
+    return password_hasher.hash(pw)
 
 
 def verify_pw(pw_str, pw_hash):
-    return sha256_crypt.verify(pw_str, pw_hash)
+    return password_hasher.verify(pw_str, pw_hash)
 
 
 def verify_signup_input(f):
@@ -0,0 +1,133 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from src.app import db
+from src.app.utils.utils import insert_messages
+
+
+class WriterTimeout(Exception):
+    """
+    Raised when a queued message was not written within the timeout. It is
+    dropped from the queue, so the send can be retried safely.
+    """
+
+
+class GroupCommitWriter(object):
+    """
+    Collects the messages sent concurrently within a short window and writes them
+    from a background thread with one INSERT and one commit.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.window = 0
+        self.max_batch_size = 0
+        self.timeout = None
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('MESSAGE_GROUP_COMMIT', False)
+        self.window = app.config.get('MESSAGE_GROUP_COMMIT_WINDOW_MS', 5) / 1000
+        self.max_batch_size = app.config.get('MESSAGE_GROUP_COMMIT_MAX_SIZE', 500)
+        self.timeout = app.config.get('MESSAGE_GROUP_COMMIT_TIMEOUT', 10)
+        app.extensions['message_writer'] = self
+
+    def submit(self, row):
+        """
+        Queues a message row and blocks until the batch holding it is committed.
+        Returns the id of the new message, or raises WriterTimeout when the row
+        was still queued after the timeout.
+        """
+        future = Future()
+        self._get_queue().put((row, future))
+
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # a row still waiting in the queue is dropped, one already being written
+            # is waited for so the caller never retries a message that gets committed
+            if future.cancel():
+                raise WriterTimeout()
+            return future.result()
+
+    def _get_queue(self):
+        # threads do not survive a fork, so every worker process starts its own writer,
+        # and a writer that died is restarted on the same queue
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                    self._thread = None
+                    self._pid = os.getpid()
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                    name='message-writer', daemon=True)
+                    self._thread.start()
+        return self._queue
+
+    def _run(self, pending):
+        while True:
+            batch = self._take_batch(pending)
+            if not batch:
+                continue
+
+            try:
+                self._flush(batch)
+            except Exception as error:
+                logging.error(error)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    def _take_batch(self, pending):
+        batch = []
+        deadline = None
+
+        while len(batch) < self.max_batch_size:
+            try:
+                if deadline is None:
+                    item = pending.get()
+                    deadline = time.monotonic() + self.window
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            # rows whose sender timed out were cancelled and are skipped
+            if item[1].set_running_or_notify_cancel():
+                batch.append(item)
+
+        return batch
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                msg_ids = insert_messages([row for row, _ in batch])
+                db.session.commit()
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                db.session.rollback()
+                return
+
+            # resolved before the context is torn down, as the rows are committed by now
+            for (_, future), msg_id in zip(batch, msg_ids):
+                future.set_result(msg_id)
+
+
+message_writer = GroupCommitWriter()
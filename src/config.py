@@ -8,18 +8,102 @@ class Config(object):
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     JWT_BLACKLIST_ENABLED = True
-    JWT_BLACKLIST_TOKEN_CHECKS = ['access']
+    JWT_BLACKLIST_TOKEN_CHECKS = ['access', 'refresh']
+    # seconds between refreshes of the in-memory revoked token set from the database
+    REVOKED_TOKEN_REFRESH_SECONDS = 5
+    # recent ids re-read on every refresh, catching logouts committed after a higher id
+    REVOKED_TOKEN_LOOKBACK_ROWS = 1000
+
+    # processes hashing passwords per worker, 0 hashes on the request thread
+    PASSWORD_HASH_WORKERS = 2
+    # hashes a worker queues before login and signup answer 503
+    PASSWORD_HASH_MAX_PENDING = 16
+    PASSWORD_HASH_TIMEOUT = 10
+
+    # responses smaller than this many bytes are sent uncompressed
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+
+    # 'local' keeps rendered conversation details per worker, 'redis' shares them
+    # through CONVERSATION_CACHE_URL and needs the redis package
+    CONVERSATION_CACHE_BACKEND = 'local'
+    CONVERSATION_CACHE_SIZE = 1024
+    CONVERSATION_CACHE_TTL = 60
+    CONVERSATION_CACHE_URL = 'redis://localhost:6379/0'
+
+    # seconds a worker trusts its copy of a group's member ids
+    MEMBERSHIP_CACHE_TTL = 60
+    MEMBERSHIP_CACHE_SIZE = 4096
+    # groups with more members than this are cached as a sorted array rather than a set
+    MEMBERSHIP_CACHE_ARRAY_THRESHOLD = 1000
+
+    # number of messages accepted by a single batch send
+    MESSAGE_BATCH_MAX_SIZE = 100
+
+    # batch concurrent message sends into one commit made by a background writer
+    MESSAGE_GROUP_COMMIT = False
+    # how long the writer waits for more messages before committing a batch
+    MESSAGE_GROUP_COMMIT_WINDOW_MS = 5
+    MESSAGE_GROUP_COMMIT_MAX_SIZE = 500
+    # seconds a send waits for its batch to be committed
+    MESSAGE_GROUP_COMMIT_TIMEOUT = 10
+
+    # upper bound in seconds for the ?wait= long-poll parameter
+    POLL_MAX_WAIT = 30
+    # number of long-polls and event streams a single worker can keep parked at once
+    POLL_MAX_WAITERS = 100
+
+    # seconds between keepalive comments on an idle event stream
+    STREAM_KEEPALIVE = 15
+    # seconds before an event stream is closed so the client reconnects with Last-Event-ID
+    STREAM_MAX_DURATION = 300
+
+    # count the statements run by each request
+    QUERY_INSTRUMENTATION = True
+    # return the counts as X-Query-* response headers, kept off in production
+    QUERY_STATS_HEADERS = False
+    # statements a request may run before a warning is logged, overridable per endpoint
+    QUERY_BUDGET = 15
+    QUERY_BUDGETS = {
+        'sync_messages': 30,
+        'create_messages_batch': 30
+    }
+
+    # expose request, pool, cache and token blacklist metrics on /metrics
+    METRICS_ENABLED = True
+    # directory shared by the workers of one server, each writes its totals there so any
+    # of them can report the sum. Leave unset for a single process and clear it on restart
+    METRICS_DIR = None
+    METRICS_FLUSH_SECONDS = 5
+
+    # fraction of requests profiled with cProfile, 0 installs no profiling hooks
+    PROFILE_SAMPLE_RATE = 0
+    # key for the X-Profile-Signature header that profiles a single request, see `flask profile sign`
+    PROFILE_SECRET = None
+    # defaults to the profiles directory of the instance folder
+    PROFILE_DIR = None
+    PROFILE_MAX_FILES = 200
+
+    # statements slower than this are appended to SLOW_QUERY_LOG, None turns the log off
+    SLOW_QUERY_THRESHOLD_MS = 200
+    # explain the first slow occurrence of each query shape
+    SLOW_QUERY_EXPLAIN = True
+    # defaults to slow_queries.jsonl in the instance folder
+    SLOW_QUERY_LOG = None
 
 
 class DevelopmentConfiguration(Config):
     SQLALCHEMY_ECHO = True
     SQLALCHEMY_TRACK_MODIFICATIONS = True
+    QUERY_STATS_HEADERS = True
 
 
 class TestingConfiguration(Config):
     TESTING = True
     DEBUG = False
     JSONIFY_PRETTYPRINT_REGULAR = False
+    PASSWORD_HASH_WORKERS = 0
+    QUERY_STATS_HEADERS = True
     SQLALCHEMY_DATABASE_URI = ""
 
 
@@ -1,4 +1,9 @@
-from .app import create_flask_app, db
+import json
+import click
+from flask.cli import AppGroup
+
+from .app import create_flask_app, db, bench
+from .app.utils.profiling import request_profiler, sign_profile_request, top_functions
 from .app.models.models import User, RevokedAccessToken, Conversation, Message
 
 app = create_flask_app()
@@ -8,3 +13,68 @@ app = create_flask_app()
 def make_shell_context():
     return {'db': db, 'User': User, 'RevokedAccessToken': RevokedAccessToken,
             'Conversation': Conversation, 'Message': Message}
+
+
+@app.cli.command('prune-revoked-tokens')
+def prune_revoked_tokens():
+    """Delete the revoked tokens whose JWT has expired."""
+    deleted = RevokedAccessToken.prune_expired()
+    click.echo(f'Deleted {deleted} expired revoked tokens')
+
+
+bench_cli = AppGroup('bench', help='Seed synthetic data and benchmark the API.')
+
+
+@bench_cli.command('seed')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--personal', default=2000, show_default=True, help='Personal conversations.')
+@click.option('--groups', default=100, show_default=True, help='Group conversations.')
+@click.option('--messages', default=50000, show_default=True)
+@click.option('--max-group-size', default=500, show_default=True)
+@click.option('--seed', 'random_seed', default=42, show_default=True)
+def bench_seed(users, personal, groups, messages, max_group_size, random_seed):
+    """Bulk insert synthetic users, conversations and messages."""
+    counts = bench.seed(users=users, personal=personal, groups=groups, messages=messages,
+                        max_group_size=max_group_size, random_seed=random_seed)
+    click.echo(json.dumps(counts, indent=2))
+
+
+@bench_cli.command('run')
+@click.option('--iterations', default=200, show_default=True, help='Rounds of send, history, poll, inbox and detail.')
+@click.option('--auth-iterations', default=20, show_default=True, help='Signups and logins.')
+@click.option('--seed', 'random_seed', default=42, show_default=True)
+@click.option('--output', type=click.File('w'), default='-', help='File the JSON results are written to.')
+def bench_run(iterations, auth_iterations, random_seed, output):
+    """Benchmark the endpoints against the seeded data."""
+    results = bench.run(app, iterations=iterations, auth_iterations=auth_iterations, random_seed=random_seed)
+    json.dump(results, output, indent=2)
+    output.write('\n')
+
+
+app.cli.add_command(bench_cli)
+
+
+profile_cli = AppGroup('profile', help='Inspect the profiles of sampled requests.')
+
+
+@profile_cli.command('top')
+@click.option('--endpoint', help='Only aggregate the profiles of this endpoint.')
+@click.option('--limit', default=20, show_default=True)
+@click.option('--sort', default='cumulative', show_default=True, help='pstats sort key, e.g. tottime.')
+def profile_top(endpoint, limit, sort):
+    """Print the hottest functions across the stored profiles."""
+    report = top_functions(request_profiler.directory, endpoint=endpoint, limit=limit, sort=sort)
+    click.echo(report or f'No profiles found in {request_profiler.directory}')
+
+
+@profile_cli.command('sign')
+@click.argument('path')
+@click.option('--ttl', default=300, show_default=True, help='Seconds the signature stays valid.')
+def profile_sign(path, ttl):
+    """Print the X-Profile-Signature header that profiles a request to PATH."""
+    if not app.config.get('PROFILE_SECRET'):
+        raise click.UsageError('PROFILE_SECRET is not configured')
+    click.echo(f'X-Profile-Signature: {sign_profile_request(app.config["PROFILE_SECRET"], path, ttl)}')
+
+
+app.cli.add_command(profile_cli)
@@ -0,0 +1,132 @@
+import os
+import threading
+from datetime import datetime
+
+import pytest
+from flask import Flask
+from flask_migrate import Migrate, upgrade
+
+from src.app import db
+from src.app.models import models
+from src.app.utils import writer as writer_module
+from src.app.utils.writer import GroupCommitWriter, WriterTimeout
+
+
+Message = models.Message
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'src', 'migrations')
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path / "writer.db"}',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        MESSAGE_GROUP_COMMIT=True,
+        MESSAGE_GROUP_COMMIT_WINDOW_MS=50,
+        MESSAGE_GROUP_COMMIT_TIMEOUT=5
+    )
+    db.init_app(app)
+    Migrate(app, db)
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+    yield app
+
+
+@pytest.fixture
+def writer(app):
+    return GroupCommitWriter(app)
+
+
+def message_row(index):
+    return {
+        'content': f'message {index}',
+        'owner': 1,
+        'conversation_id': 1,
+        'created_at': datetime.utcnow()
+    }
+
+
+def submit_concurrently(writer, count):
+    results = [None] * count
+
+    def send(index):
+        try:
+            results[index] = writer.submit(message_row(index))
+        except Exception as error:
+            results[index] = error
+
+    threads = [threading.Thread(target=send, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_sends_are_committed_in_one_batch(app, writer, monkeypatch):
+    batch_sizes = []
+    insert_messages = writer_module.insert_messages
+
+    def recording_insert(rows):
+        batch_sizes.append(len(rows))
+        return insert_messages(rows)
+
+    monkeypatch.setattr(writer_module, 'insert_messages', recording_insert)
+
+    msg_ids = submit_concurrently(writer, 20)
+
+    assert len(set(msg_ids)) == 20
+    assert sum(batch_sizes) == 20 and len(batch_sizes) < 20
+    with app.app_context():
+        stored = dict(db.session.query(Message.id, Message.content))
+    assert sorted(stored) == sorted(msg_ids)
+
+
+def test_failed_batch_rejects_every_send_and_writer_keeps_running(app, writer, monkeypatch):
+    def failing_insert(rows):
+        raise RuntimeError('database unavailable')
+
+    def failing_rollback():
+        raise RuntimeError('rollback failed')
+
+    monkeypatch.setattr(writer_module, 'insert_messages', failing_insert)
+    monkeypatch.setattr(db.session, 'rollback', failing_rollback)
+
+    results = submit_concurrently(writer, 5)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    monkeypatch.undo()
+    assert isinstance(writer.submit(message_row(0)), int)
+
+
+def test_timed_out_send_is_not_written(app, writer, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    insert_messages = writer_module.insert_messages
+
+    def slow_insert(rows):
+        started.set()
+        release.wait(5)
+        return insert_messages(rows)
+
+    monkeypatch.setattr(writer_module, 'insert_messages', slow_insert)
+
+    # the first send keeps the writer busy while the second one waits in the queue
+    first = threading.Thread(target=writer.submit, args=(message_row(0),))
+    first.start()
+    started.wait(5)
+
+    writer.timeout = 0.1
+    with pytest.raises(WriterTimeout):
+        writer.submit(message_row(1))
+
+    release.set()
+    first.join()
+    writer.timeout = 5
+    writer.submit(message_row(2))
+
+    with app.app_context():
+        contents = [content for content, in db.session.query(Message.content).order_by(Message.id)]
+    assert contents == ['message 0', 'message 2']